@@ -0,0 +1,141 @@
+"""Benchmark Backends
+
+Compares the summarizer inference backends (summarize.py) on abstracts from
+results/papers_to_tweet.csv: latency per abstract, peak RSS, and ROUGE-1 /
+ROUGE-L F1 drift of each backend's summaries against PyTorch fp32.
+
+Each backend runs in its own fresh process so that peak RSS is measured
+for that backend alone.
+
+Usage:
+    python bench_backends.py [--n-abstracts 32] [--backends torch int8 onnx] [--json out.json]
+"""
+# imports
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+import os
+import re
+import resource
+import sys
+import time
+
+import pandas as pd
+
+from summarize import load_summarizer, summarize_batched, summarizer_backends
+
+# variables
+path_csv = os.path.join("..", "results", "papers_to_tweet.csv")
+prompt = "Summarize the following abstract from a scientific article: %s"
+model = "../bart-large-cnn"
+generation_params = {"max_length": 40, "min_length": 10, "do_sample": False}
+
+
+# functions
+def peak_rss_mb():
+    """Peak resident set size of this process, in MB."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss / 1024**2 if sys.platform == "darwin" else max_rss / 1024
+
+
+def run_backend(model, backend, texts, batch_size):
+    """Summarize `texts` with `backend`; runs in a child process."""
+    start = time.perf_counter()
+    summarizer = load_summarizer(model, backend=backend)
+    load_time = time.perf_counter() - start
+    summarizer(texts[0], **generation_params)  # warm-up
+
+    start = time.perf_counter()
+    summaries = summarize_batched(
+        summarizer, texts, batch_size=batch_size, **generation_params
+    )
+    elapsed = time.perf_counter() - start
+    return {
+        "backend": backend,
+        "load_s": load_time,
+        "latency_ms_per_abstract": 1000 * elapsed / len(texts),
+        "peak_rss_mb": peak_rss_mb(),
+        "summaries": summaries,
+    }
+
+
+def tokens(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def f1(overlap, n_candidate, n_reference):
+    if overlap == 0:
+        return 0.0
+    precision, recall = overlap / n_candidate, overlap / n_reference
+    return 2 * precision * recall / (precision + recall)
+
+
+def rouge_1(candidate, reference):
+    candidate, reference = tokens(candidate), tokens(reference)
+    overlap = sum((Counter(candidate) & Counter(reference)).values())
+    return f1(overlap, len(candidate), len(reference))
+
+
+def rouge_l(candidate, reference):
+    candidate, reference = tokens(candidate), tokens(reference)
+    # longest common subsequence, one row at a time
+    previous = [0] * (len(reference) + 1)
+    for token in candidate:
+        current = [0]
+        for j, reference_token in enumerate(reference):
+            if token == reference_token:
+                current.append(previous[j] + 1)
+            else:
+                current.append(max(previous[j + 1], current[j]))
+        previous = current
+    return f1(previous[-1], len(candidate), len(reference))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n-abstracts", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument(
+        "--backends", nargs="+", default=list(summarizer_backends), choices=summarizer_backends
+    )
+    parser.add_argument("--model", default=model)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    abstracts = pd.read_csv(path_csv)["abstract"].dropna().head(args.n_abstracts)
+    texts = [prompt % abstract for abstract in abstracts]
+
+    # fp32 is the reference for ROUGE drift, so it always runs first
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results.append(
+                executor.submit(
+                    run_backend, args.model, backend, texts, args.batch_size
+                ).result()
+            )
+
+    reference = results[0]["summaries"]
+    print(f"{'backend':<8} {'load s':>8} {'ms/abstract':>12} {'peak RSS MB':>12} {'ROUGE-1':>8} {'ROUGE-L':>8}")
+    for result in results:
+        pairs = list(zip(result["summaries"], reference))
+        result["rouge_1"] = sum(rouge_1(c, r) for c, r in pairs) / len(pairs)
+        result["rouge_l"] = sum(rouge_l(c, r) for c, r in pairs) / len(pairs)
+        print(
+            f"{result['backend']:<8} {result['load_s']:>8.1f} "
+            f"{result['latency_ms_per_abstract']:>12.1f} {result['peak_rss_mb']:>12.0f} "
+            f"{result['rouge_1']:>8.3f} {result['rouge_l']:>8.3f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                [{k: v for k, v in r.items() if k != "summaries"} for r in results],
+                f,
+                indent=2,
+            )
@@ -0,0 +1,68 @@
+"""Benchmark Citations
+
+Compares the one-request-per-PMID citation path against batched ELink
+requests: wall time, HTTP requests sent (retries included, as counted by
+the client), requests/sec and PMIDs/sec. PMIDs are taken from
+results/papers_to_tweet.csv unless given on the command line.
+
+Usage:
+    python bench_citations.py [--n-pmids 200] [--batch-size 200] [pmid ...]
+"""
+# imports
+import argparse
+import asyncio
+import os
+import time
+
+import pandas as pd
+
+from citations import fetch_citations_for_papers_async
+from eutils import EUtilsClient
+
+# variables
+path_csv = os.path.join("..", "results", "papers_to_tweet.csv")
+
+
+# functions
+async def time_citations_async(pmids, batch_size):
+    papers = [{"pmid": pmid} for pmid in pmids]
+    async with EUtilsClient() as client:
+        start = time.perf_counter()
+        papers = await fetch_citations_for_papers_async(client, papers, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+    return [paper["citations"] for paper in papers], client.n_requests, elapsed
+
+
+def time_citations(pmids, batch_size):
+    """Run fetch_citations_for_papers and return (counts, HTTP requests
+    sent, seconds)."""
+    return asyncio.run(time_citations_async(pmids, batch_size))
+
+
+def report(label, n_pmids, n_requests, elapsed):
+    print(
+        f"{label:<12} pmids={n_pmids:<6} requests={n_requests:<6} "
+        f"wall={elapsed:8.2f}s  req/s={n_requests / elapsed:7.2f}  "
+        f"pmids/s={n_pmids / elapsed:8.2f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pmids", nargs="*", help="PMIDs to look up")
+    parser.add_argument("--n-pmids", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    pmids = args.pmids or [
+        str(pmid) for pmid in pd.read_csv(path_csv)["pmid"].head(args.n_pmids)
+    ]
+
+    single_counts, single_requests, single_time = time_citations(pmids, batch_size=None)
+    report("per-PMID", len(pmids), single_requests, single_time)
+
+    batch_counts, batch_requests, batch_time = time_citations(pmids, batch_size=args.batch_size)
+    report("batched", len(pmids), batch_requests, batch_time)
+
+    mismatches = sum(a != b for a, b in zip(single_counts, batch_counts))
+    print(f"speed-up: {single_time / batch_time:.1f}x  mismatching counts: {mismatches}")
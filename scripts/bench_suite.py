@@ -0,0 +1,367 @@
+"""Benchmark Suite
+
+Times each stage of the pipeline offline, against the local E-utilities
+stand-in (stand_in_server.py) replaying recorded PubMed records, and
+writes the results as JSON so runs can be compared over time.
+
+Stages:
+    parse       iterparse of an efetch response (pubmed.iter_parse_articles)
+    fetch       paged esearch/efetch through the client, as one search and by
+                journal shard (pubmed.iter_search_papers_async, iter_sharded_papers_async)
+    cite        citation counts, per-PMID and batched (citations.fetch_citation_counts_async)
+    filter      citation/tweeted filtering of the paper DataFrame
+    render      tweet composition for the whole table (tweet_render.render_tweets)
+    extract     extractive summarization (extractive.extract_summaries), with the
+                share of confident picks and the summary lengths
+    summarize   summarization per batch size, then pure BART vs hybrid
+                throughput and summary lengths (needs the model, opt-in)
+    publish     posting to 4 channels (2 X accounts, Mastodon, Bluesky): one
+                channel at a time, fanned out per paper (the writer) and all
+                papers at once, against stand_in_channels.py
+
+Usage:
+    python bench_suite.py --scale 20 --latency 0.05 --error-rate 0.02 --output bench.json
+    python bench_suite.py --stages summarize --batch-sizes 1 8 --n-abstracts 16
+    python bench_suite.py --stages extract summarize --n-abstracts 64
+    python bench_suite.py --stages publish --latency 0.2 --error-rate 0.1 --n-posts 50
+
+Structure:
+    1. Imports, Variables
+    2. Benchmarks
+    3. Main
+"""
+# 1. Imports, Variables
+# imports
+import argparse
+import asyncio
+import json
+import os
+import platform
+import time
+
+import numpy as np
+import pandas as pd
+
+import citations
+import pubmed
+from eutils import EUtilsClient
+from stand_in_server import StandInServer, efetch_xml, load_records
+from tweet_render import render_tweets, summary_budgets, weighted_length
+
+# variables
+all_stages = ("parse", "fetch", "cite", "filter", "render", "extract", "summarize", "publish")
+default_stages = ("parse", "fetch", "cite", "filter", "render", "extract", "publish")
+prompt = "Summarize the following abstract from a scientific article: %s"
+model = "../bart-large-cnn"
+generation_params = {"max_length": 40, "min_length": 10, "do_sample": False}
+
+
+# 2. Benchmarks
+def result(stage, variant, items, seconds, **extra):
+    return dict(
+        stage=stage,
+        variant=variant,
+        items=items,
+        seconds=round(seconds, 6),
+        items_per_s=round(items / seconds, 3) if seconds else None,
+        **extra,
+    )
+
+
+def bench_parse(records):
+    content = efetch_xml(records).encode()
+    start = time.perf_counter()
+    papers = list(pubmed.iter_parse_articles(content))
+    return [result("parse", "iterparse", len(papers), time.perf_counter() - start, bytes=len(content))]
+
+
+async def bench_network(records, stages, args):
+    """fetch and cite, against a stand-in server started in this process."""
+    journals = [f"Journal {i}" for i in range(args.shards)]
+    server = StandInServer(
+        records, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        journals=journals,
+    )
+    base_url = await server.start()
+    results = []
+    # the stand-in has no rate limit: the client's limiter is set high so
+    # that the stage itself, not NCBI's 3 req/s, is measured
+    client_kwargs = dict(base_url=base_url, rate=args.rate, backoff=0.01)
+    try:
+        if "fetch" in stages:
+            async with EUtilsClient(**client_kwargs) as client:
+                start = time.perf_counter()
+                papers = [
+                    paper
+                    async for paper in pubmed.iter_search_papers_async(
+                        client, "stand-in", page_size=args.page_size
+                    )
+                ]
+                results.append(
+                    result(
+                        "fetch", f"paged ({args.page_size})", len(papers),
+                        time.perf_counter() - start, requests=client.n_requests,
+                    )
+                )
+            async with EUtilsClient(**client_kwargs) as client:
+                start = time.perf_counter()
+                shards = pubmed.plan_shards([f'"{j}"[Journal]' for j in journals], days_ago=460)
+                papers = [
+                    paper
+                    async for paper in pubmed.iter_sharded_papers_async(
+                        client, shards, page_size=args.page_size
+                    )
+                ]
+                results.append(
+                    result(
+                        "fetch", f"sharded ({args.shards} journals)", len(papers),
+                        time.perf_counter() - start, requests=client.n_requests,
+                    )
+                )
+
+        if "cite" in stages:
+            pmids = [str(record["pmid"]) for record in records[: args.n_cite]]
+            for variant, batch_size in (("per-PMID", None), ("batched", args.citation_batch_size)):
+                async with EUtilsClient(**client_kwargs) as client:
+                    start = time.perf_counter()
+                    await citations.fetch_citation_counts_async(client, pmids, batch_size=batch_size)
+                    results.append(
+                        result(
+                            "cite", variant, len(pmids), time.perf_counter() - start,
+                            requests=client.n_requests,
+                        )
+                    )
+    finally:
+        await server.stop()
+    results.append(
+        dict(stage="server", variant="stand-in", requests=server.n_requests, errors_injected=server.n_errors)
+    )
+    return results
+
+
+def bench_filter(records, min_citations=1):
+    df_papers = pd.DataFrame(records)
+    tweeted_pmids = set(df_papers["pmid"].sample(frac=0.5, random_state=0))
+    start = time.perf_counter()
+    kept = df_papers[
+        (df_papers["citations"] >= min_citations) & ~df_papers["pmid"].isin(tweeted_pmids)
+    ]
+    results = [result("filter", "DataFrame", len(df_papers), time.perf_counter() - start, kept=len(kept))]
+
+    papers = df_papers.to_dict("records")
+    start = time.perf_counter()
+    kept = [
+        p for p in papers if p["citations"] >= min_citations and p["pmid"] not in tweeted_pmids
+    ]
+    results.append(result("filter", "list", len(papers), time.perf_counter() - start, kept=len(kept)))
+    return results
+
+
+def bench_render(records):
+    df_papers = pd.DataFrame(records)
+    df_papers["doi_link"] = "https://doi.org/" + df_papers["doi"].fillna("")
+    # a summary-sized first sentence of the abstract
+    df_papers["abstract_summary"] = df_papers["abstract"].str.split(". ").str[0]
+    start = time.perf_counter()
+    render_tweets(df_papers)
+    return [result("render", "vectorized", len(df_papers), time.perf_counter() - start)]
+
+
+def summary_papers(records):
+    """Records with an abstract, as a DataFrame with a doi_link."""
+    df_papers = pd.DataFrame([r for r in records if isinstance(r["abstract"], str) and r["abstract"]])
+    df_papers["doi_link"] = "https://doi.org/" + df_papers["doi"].fillna("")
+    return df_papers.reset_index(drop=True)
+
+
+def length_stats(summaries, budgets):
+    """Weighted length (mean, p95) of `summaries` and the share fitting
+    their tweet without truncation."""
+    lengths = weighted_length(pd.Series([summary or "" for summary in summaries]))
+    return dict(
+        mean_length=round(float(lengths.mean()), 1),
+        p95_length=round(float(np.percentile(lengths, 95)), 1),
+        fits=round(float(np.mean(lengths <= budgets)), 3),
+    )
+
+
+def bench_extract(records):
+    from extractive import extract_summaries
+
+    df_papers = summary_papers(records)
+    budgets = summary_budgets(df_papers)
+    extract_summaries(df_papers["abstract"][:10], budgets[:10])  # warm-up: loads spaCy
+    start = time.perf_counter()
+    summaries, confident = extract_summaries(df_papers["abstract"], budgets)
+    seconds = time.perf_counter() - start
+    return [
+        result(
+            "extract", "extractive", len(df_papers), seconds,
+            confident=round(float(confident.mean()), 3), **length_stats(summaries, budgets),
+        )
+    ]
+
+
+def bench_summarize(records, args):
+    from extractive import extract_summaries
+    from summarize import load_summarizer, summarize_batched
+
+    df_papers = summary_papers(records)[: args.n_abstracts]
+    budgets = summary_budgets(df_papers)
+    texts = [prompt % abstract for abstract in df_papers["abstract"]]
+    summarizer = load_summarizer(args.model)
+    summarizer(texts[0], **generation_params)  # warm-up
+    results = []
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        summarize_batched(summarizer, texts, batch_size=batch_size, **generation_params)
+        results.append(
+            result("summarize", f"batch {batch_size}", len(texts), time.perf_counter() - start)
+        )
+
+    # pure BART vs hybrid (BART only for the abstracts without a confident pick)
+    batch_size = max(args.batch_sizes)
+    start = time.perf_counter()
+    summaries = summarize_batched(summarizer, texts, batch_size=batch_size, **generation_params)
+    results.append(
+        result(
+            "summarize", "abstractive", len(texts), time.perf_counter() - start,
+            **length_stats(summaries, budgets),
+        )
+    )
+    start = time.perf_counter()
+    summaries, confident = extract_summaries(df_papers["abstract"], budgets)
+    fallback = np.flatnonzero(~confident)
+    for i, summary in zip(
+        fallback,
+        summarize_batched(
+            summarizer, [texts[i] for i in fallback], batch_size=batch_size, **generation_params
+        ),
+    ):
+        summaries[i] = summary
+    results.append(
+        result(
+            "summarize", "hybrid", len(texts), time.perf_counter() - start,
+            abstractive=len(fallback), **length_stats(summaries, budgets),
+        )
+    )
+    return results
+
+
+async def bench_publish(records, args):
+    """Posting, against a stand-in of the channels' APIs started in this
+    process."""
+    from publisher import BlueskyChannel, MastodonChannel, Publisher, XChannel, publish_all
+    from tweet_render import render_tweet
+    from stand_in_channels import StandInChannels
+
+    server = StandInChannels(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    base_url = await server.start()
+    # stand-in credentials
+    for name in ("BENCH_X_ACCESS_TOKEN", "BENCH_MASTODON_TOKEN", "BENCH_BLUESKY_HANDLE", "BENCH_BLUESKY_PASSWORD"):
+        os.environ.setdefault(name, name.lower())
+    os.environ.setdefault("BENCH_LAB_ACCESS_TOKEN", "bench_lab")
+    channels = [
+        XChannel("x", env_prefix="BENCH_X_", rate=args.rate, base_url=base_url),
+        XChannel("x-lab", env_prefix="BENCH_LAB_", rate=args.rate, base_url=base_url),
+        MastodonChannel("mastodon", base_url, token_env="BENCH_MASTODON_TOKEN", rate=args.rate),
+        BlueskyChannel(
+            "bluesky", base_url, handle_env="BENCH_BLUESKY_HANDLE",
+            password_env="BENCH_BLUESKY_PASSWORD", rate=args.rate,
+        ),
+    ]
+    names = [channel.name for channel in channels]
+    publisher_kwargs = dict(backoff=0.01)
+    results = []
+    try:
+        for variant in ("one channel at a time", "fanned out per paper", "all at once"):
+            papers = [
+                dict(
+                    pmid=record["pmid"],
+                    title=f"{variant}: {record['title']} {record['pmid']}",
+                    doi_link=f"https://doi.org/{record['doi']}" if record["doi"] else "Link not available",
+                    abstract_summary=record["abstract"],
+                )
+                for record in records[: args.n_posts]
+            ]
+            for paper in papers:
+                paper["tweet_text"] = render_tweet(paper)
+            start = time.perf_counter()
+            if variant == "all at once":
+                outcomes = await publish_all(channels, [(paper, names) for paper in papers], **publisher_kwargs)
+            else:
+                outcomes = []
+                async with Publisher(channels, **publisher_kwargs) as publisher:
+                    for paper in papers:
+                        texts = {channel.name: channel.render(paper) for channel in channels}
+                        if variant == "fanned out per paper":
+                            outcomes.append(await publisher.publish(texts, names, paper["pmid"]))
+                            continue
+                        outcome = {}
+                        for name in names:
+                            outcome.update(await publisher.publish(texts, [name], paper["pmid"]))
+                        outcomes.append(outcome)
+            seconds = time.perf_counter() - start
+            deliveries = [delivery for outcome in outcomes for delivery in outcome.values()]
+            results.append(
+                result(
+                    "publish", variant, len(deliveries), seconds,
+                    failed=sum(post_id is None for post_id, _ in deliveries),
+                )
+            )
+    finally:
+        await server.stop()
+    results.append(
+        dict(stage="channels", variant="stand-in", requests=server.n_requests, errors_injected=server.n_errors)
+    )
+    return results
+
+
+# 3. Main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stages", nargs="+", default=list(default_stages), choices=all_stages)
+    parser.add_argument("--scale", type=int, default=10, help="repeat the recorded records N times")
+    parser.add_argument("--latency", type=float, default=0.0, help="stand-in seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 429/503 responses")
+    parser.add_argument("--rate", type=float, default=1000.0, help="client requests/s")
+    parser.add_argument("--page-size", type=int, default=pubmed.efetch_page_size)
+    parser.add_argument("--shards", type=int, default=8, help="journals of the sharded fetch")
+    parser.add_argument("--n-cite", type=int, default=500, help="PMIDs in the cite stage")
+    parser.add_argument("--citation-batch-size", type=int, default=citations.citation_batch_size)
+    parser.add_argument("--n-posts", type=int, default=50, help="papers in the publish stage")
+    parser.add_argument("--n-abstracts", type=int, default=16)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--model", default=model)
+    parser.add_argument("--output", help="JSON file to write (default: stdout)")
+    args = parser.parse_args()
+
+    records = load_records(scale=args.scale)
+    results = []
+    if "parse" in args.stages:
+        results += bench_parse(records)
+    if {"fetch", "cite"} & set(args.stages):
+        results += asyncio.run(bench_network(records, args.stages, args))
+    if "filter" in args.stages:
+        results += bench_filter(records)
+    if "render" in args.stages:
+        results += bench_render(records)
+    if "extract" in args.stages:
+        results += bench_extract(records)
+    if "summarize" in args.stages:
+        results += bench_summarize(records, args)
+    if "publish" in args.stages:
+        results += asyncio.run(bench_publish(records, args))
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
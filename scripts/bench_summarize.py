@@ -0,0 +1,58 @@
+"""Benchmark Summarize
+
+Compares the row-by-row summarization loop against batched, length-bucketed
+summarization (summarize.py) on abstracts from results/papers_to_tweet.csv,
+reporting abstracts/sec for each batch size.
+
+Usage:
+    python bench_summarize.py [--n-abstracts 32] [--batch-sizes 1 4 8 16]
+"""
+# imports
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from summarize import load_summarizer, summarize_batched
+
+# variables
+path_csv = os.path.join("..", "results", "papers_to_tweet.csv")
+prompt = "Summarize the following abstract from a scientific article: %s"
+model = "../bart-large-cnn"
+generation_params = {"max_length": 40, "min_length": 10, "do_sample": False}
+
+
+# functions
+def report(label, n_abstracts, elapsed):
+    print(
+        f"{label:<16} abstracts={n_abstracts:<5} wall={elapsed:8.2f}s  "
+        f"abstracts/s={n_abstracts / elapsed:6.2f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n-abstracts", type=int, default=32)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--model", default=model)
+    args = parser.parse_args()
+
+    abstracts = pd.read_csv(path_csv)["abstract"].dropna().head(args.n_abstracts)
+    texts = [prompt % abstract for abstract in abstracts]
+    summarizer = load_summarizer(args.model)
+    summarizer(texts[0], **generation_params)  # warm-up
+
+    # current loop: one abstract per call
+    start = time.perf_counter()
+    for text in texts:
+        summarizer(text, **generation_params)[0]["summary_text"]
+    baseline = time.perf_counter() - start
+    report("row-by-row", len(texts), baseline)
+
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        summarize_batched(summarizer, texts, batch_size=batch_size, **generation_params)
+        elapsed = time.perf_counter() - start
+        report(f"batched ({batch_size})", len(texts), elapsed)
+        print(f"{'':<16} speed-up vs row-by-row: {baseline / elapsed:.2f}x")
@@ -0,0 +1,150 @@
+"""Citation Cache
+
+Persistent cache of ELink citation counts, keyed by PMID, so a warm reader
+run only re-queries the counts that are due for a refresh.
+
+How often a count is refreshed depends on its RefreshPolicy:
+    - young papers (first cached recently) are refreshed often, since that
+      is when citations accumulate fastest,
+    - older papers are refreshed less and less often,
+    - papers whose count has not changed for `stable_after_days` are only
+      refreshed every `stable_refresh_days`.
+A paper's age is counted from the first time its count was cached; since
+the reader harvests a rolling window of recent papers, this follows the
+publication age once the initial window has been cached.
+
+Structure:
+    1. Imports, Variables
+    2. RefreshPolicy
+    3. CitationCache
+"""
+# 1. Imports, Variables
+# imports
+import os
+import sqlite3
+import time
+
+# variables
+default_path = os.path.join("..", "results", "pubmed.sqlite")
+max_sql_variables = 500  # PMIDs per IN (...) query
+day = 24 * 60 * 60
+
+
+# 2. RefreshPolicy
+class RefreshPolicy:
+    """Refresh interval of a cached count, from the paper's age.
+
+    `tiers` is a list of (max_age_days, refresh_days): a paper younger than
+    `max_age_days` is refreshed every `refresh_days`. Papers older than
+    every tier, and stable ones, are refreshed every `stable_refresh_days`.
+    """
+
+    def __init__(
+        self,
+        tiers=((30, 1), (180, 7), (365, 14)),
+        stable_after_days=90,
+        stable_refresh_days=30,
+    ):
+        self.tiers = sorted(tiers)
+        self.stable_after_days = stable_after_days
+        self.stable_refresh_days = stable_refresh_days
+
+    def refresh_days(self, age_days, unchanged_days):
+        if unchanged_days >= self.stable_after_days:
+            return self.stable_refresh_days
+        for max_age_days, refresh_days in self.tiers:
+            if age_days < max_age_days:
+                return refresh_days
+        return self.stable_refresh_days
+
+    def is_stale(self, first_fetched, fetched_at, changed_at, now):
+        refresh_days = self.refresh_days(
+            (now - first_fetched) / day, (now - changed_at) / day
+        )
+        return now - fetched_at >= refresh_days * day
+
+
+# 3. CitationCache
+class CitationCache:
+    """SQLite-backed citation counts with hit/miss counters.
+
+    >>> with CitationCache() as cache:
+    ...     cached, stale = cache.lookup(pmids)
+    ...     cache.update(fetch(stale))
+    """
+
+    def __init__(self, path=default_path, policy=None):
+        self.path = path
+        self.policy = policy or RefreshPolicy()
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS citations (
+                pmid INTEGER PRIMARY KEY,
+                citations INTEGER,
+                first_fetched REAL,
+                fetched_at REAL,
+                changed_at REAL
+            )
+            """
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _rows(self, pmids):
+        pmids = [int(pmid) for pmid in pmids]
+        for start in range(0, len(pmids), max_sql_variables):
+            chunk = pmids[start : start + max_sql_variables]
+            placeholders = ",".join("?" * len(chunk))
+            yield from self.connection.execute(
+                f"SELECT * FROM citations WHERE pmid IN ({placeholders})", chunk
+            )
+
+    def lookup(self, pmids, now=None):
+        """
+        Split `pmids` into fresh cached counts and PMIDs to (re)fetch.
+        Returns ({pmid: citations}, [stale or unknown pmid, ...]).
+        """
+        now = time.time() if now is None else now
+        rows = {row[0]: row for row in self._rows(pmids)}
+        cached, stale = {}, []
+        for pmid in pmids:
+            row = rows.get(int(pmid))
+            if row is not None and not self.policy.is_stale(*row[2:], now):
+                cached[pmid] = row[1]
+            else:
+                stale.append(pmid)
+        self.hits += len(cached)
+        self.misses += len(stale)
+        return cached, stale
+
+    def update(self, citation_counts, now=None):
+        """Store freshly fetched counts, a dict {pmid: citations}."""
+        now = time.time() if now is None else now
+        rows = {row[0]: row for row in self._rows(citation_counts)}
+        records = []
+        for pmid, citations in citation_counts.items():
+            row = rows.get(int(pmid))
+            if row is None:
+                records.append((int(pmid), citations, now, now, now))
+            else:
+                changed_at = now if citations != row[1] else row[4]
+                records.append((int(pmid), citations, row[2], now, changed_at))
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO citations VALUES (?, ?, ?, ?, ?)", records
+            )
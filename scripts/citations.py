@@ -0,0 +1,155 @@
+"""Citations
+
+Citation counts for PubMed articles through the ELink "cited in" link.
+Requests go through the shared E-utilities client (eutils.py).
+
+Structure:
+    1. Imports, Variables
+    2. Functions
+        2.1 Single PMID (one request per PMID)
+        2.2 Batched (hundreds of PMIDs per request)
+        2.3 Papers
+"""
+# 1. Imports, Variables
+# imports
+import asyncio
+import logging
+import xml.etree.ElementTree as ET
+
+import eutils
+
+# variables
+citation_batch_size = 200  # PMIDs per ELink request in batched mode
+citedin_params = [
+    ("dbfrom", "pubmed"),
+    ("db", "pubmed"),
+    ("linkname", "pubmed_pubmed_citedin"),  # Link to citing articles
+    ("retmode", "xml"),
+]
+
+
+# 2. Functions
+# 2.1 Single PMID
+async def fetch_citation_count_async(client, pmid):
+    """
+    Fetch citation count for a given PMID.
+    """
+    content = await client.elink(
+        citedin_params + [("id", str(pmid))], method="GET"
+    )
+    root = ET.fromstring(content)
+    return len(root.findall(".//LinkSetDb/Link"))
+
+
+def fetch_citation_count(pmid):
+    """
+    Fetch citation count for a given PMID.
+    """
+    return eutils.run(fetch_citation_count_async, pmid)
+
+
+# 2.2 Batched
+def parse_citation_linksets(content):
+    """
+    Map each LinkSet of an ELink response back to its source PMID.
+
+    Returns a dict {pmid: citation_count}. PMIDs with no "cited in" links
+    come back as a LinkSet without LinkSetDb and are counted as 0.
+    """
+    root = ET.fromstring(content)
+    citation_counts = {}
+    for linkset in root.findall("LinkSet"):
+        source_id = linkset.find("IdList/Id")
+        if source_id is None:
+            continue
+        citation_counts[source_id.text] = len(linkset.findall("LinkSetDb/Link"))
+    return citation_counts
+
+
+async def fetch_citation_counts_batch_async(client, pmids):
+    """
+    Fetch citation counts for many PMIDs with a single ELink request.
+
+    Each PMID is sent as its own `id` parameter so that ELink answers with
+    one LinkSet per PMID (a comma separated list would merge them). The
+    request is POSTed because a few hundred ids overflow a GET URL.
+    """
+    content = await client.elink(
+        citedin_params + [("id", str(pmid)) for pmid in pmids]
+    )
+    citation_counts = parse_citation_linksets(content)
+    # PMIDs unknown to PubMed get no LinkSet at all
+    return [citation_counts.get(str(pmid), 0) for pmid in pmids]
+
+
+def fetch_citation_counts_batch(pmids):
+    """
+    Fetch citation counts for many PMIDs with a single ELink request.
+    """
+    return eutils.run(fetch_citation_counts_batch_async, pmids)
+
+
+# 2.3 Papers
+async def fetch_citation_counts_async(client, pmids, batch_size=citation_batch_size):
+    """
+    Fetch citation counts for many PMIDs, concurrently. Returns a dict
+    {pmid: citations}.
+
+    With `batch_size` set, PMIDs are sent `batch_size` at a time through
+    `fetch_citation_counts_batch_async`; with `batch_size=None` one request
+    is sent per PMID. Either way the client's rate limiter paces requests.
+    """
+    if batch_size:
+        batches = await asyncio.gather(
+            *(
+                fetch_citation_counts_batch_async(
+                    client, pmids[start : start + batch_size]
+                )
+                for start in range(0, len(pmids), batch_size)
+            )
+        )
+        citation_counts = [count for batch in batches for count in batch]
+    else:
+        citation_counts = await asyncio.gather(
+            *(fetch_citation_count_async(client, pmid) for pmid in pmids)
+        )
+    return dict(zip(pmids, citation_counts))
+
+
+async def fetch_citations_for_papers_async(
+    client, papers, batch_size=citation_batch_size, cache=None
+):
+    """
+    Fetch citation counts for a list of papers.
+
+    With a CitationCache (citation_cache.py), only PMIDs whose cached count
+    is missing or stale are sent to ELink, and the cache is updated with
+    the fresh counts.
+    """
+    pmids = [paper["pmid"] for paper in papers]
+    if cache is not None:
+        citation_counts, stale = cache.lookup(pmids)
+    else:
+        citation_counts, stale = {}, pmids
+
+    fetched = await fetch_citation_counts_async(client, stale, batch_size=batch_size)
+    if cache is not None:
+        cache.update(fetched)
+        logging.info(
+            f"Citation cache: {len(citation_counts)} hits, {len(stale)} fetched "
+            f"(hit rate {cache.hit_rate:.1%})"
+        )
+    citation_counts.update(fetched)
+
+    for paper in papers:
+        paper["citations"] = citation_counts[paper["pmid"]]
+    return papers
+
+
+def fetch_citations_for_papers(papers, batch_size=citation_batch_size, cache=None):
+    """
+    Fetch citation counts for a list of papers.
+    """
+    return eutils.run(
+        fetch_citations_for_papers_async, papers, batch_size=batch_size, cache=cache
+    )
@@ -0,0 +1,289 @@
+"""Dedup Index
+
+Persistent index of the papers already queued for tweeting, used to drop
+new papers that are the same work under another key: a preprint and its
+journal version, an erratum or a republication under a new PMID.
+
+Two kinds of matches:
+    - exact: same normalized DOI, or same normalized title (hashed),
+    - near-duplicate: MinHash signatures of the title (character 4-grams)
+      or of the abstract (word 3-grams) estimated at least as similar as
+      `thresholds`, found through LSH banding.
+Every lookup is an indexed SQLite query (exact keys, then one query per
+LSH band), so its cost does not grow with the size of the index;
+candidates found by LSH are confirmed on their stored signatures.
+
+The index lives in SQLite (by default next to the record store, in
+results/pubmed.sqlite) and is filled by the reader's export stage, so it
+persists between runs.
+
+    >>> with DedupIndex() as index:
+    ...     papers, duplicates = index.deduplicate(papers)
+    ...     ...
+    ...     index.add(exported_papers)
+
+Structure:
+    1. Imports, Variables
+    2. Keys and Signatures
+    3. DedupIndex
+"""
+# 1. Imports, Variables
+# imports
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import unicodedata
+import zlib
+
+import numpy as np
+
+# variables
+default_path = os.path.join("..", "results", "pubmed.sqlite")
+num_perm = 128  # MinHash permutations
+n_bands = 16  # LSH bands of num_perm / n_bands rows: candidates from ~0.7 similarity
+thresholds = {"title": 0.9, "abstract": 0.8}  # estimated Jaccard to be a duplicate
+signature_version = 2  # bump when the permutations change: stored signatures are dropped
+_prime = 4294967311  # smallest prime > 2**32, above every 32-bit shingle hash
+# a, b and the shingle hashes are all < 2**32, so a * x + b < 2**64 never
+# wraps around in uint64 before the modulo
+_rng = np.random.default_rng(20240101)  # fixed: signatures are persisted
+_a = _rng.integers(1, 2**32, num_perm, dtype=np.uint64)
+_b = _rng.integers(0, 2**32, num_perm, dtype=np.uint64)
+
+
+# 2. Keys and Signatures
+def normalize_text(text):
+    """Lowercase ASCII words of `text`, accents and punctuation removed."""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode()
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def normalize_doi(doi_link):
+    """Bare lowercase DOI of a doi_link (or DOI), None if there is none."""
+    match = re.search(r"10\.\d{4,9}/\S+", doi_link or "")
+    return match.group(0).lower().rstrip(".") if match else None
+
+
+def exact_keys(paper):
+    """Exact-match keys of `paper`: its DOI and its title hash."""
+    keys = []
+    doi = normalize_doi(paper.get("doi_link"))
+    if doi:
+        keys.append(f"doi:{doi}")
+    title = normalize_text(paper.get("title"))
+    if len(title) >= 20:  # too short titles ("Editorial") are not distinctive
+        keys.append("title:" + hashlib.sha1(title.encode()).hexdigest())
+    return keys
+
+
+def shingles(text, kind):
+    """Hashed shingles: character 4-grams for titles, word 3-grams for
+    abstracts."""
+    text = normalize_text(text)
+    if kind == "title":
+        grams = {text[i : i + 4] for i in range(len(text) - 3)}
+    else:
+        words = text.split()
+        grams = {" ".join(words[i : i + 3]) for i in range(len(words) - 2)}
+    return np.fromiter(
+        (zlib.crc32(gram.encode()) for gram in grams), dtype=np.uint64, count=len(grams)
+    )
+
+
+def minhash(hashes):
+    """MinHash signature (num_perm uint32) of a set of shingle hashes, or
+    None for an empty set."""
+    if not len(hashes):
+        return None
+    permuted = (_a[:, None] * hashes[None, :] + _b[:, None]) % _prime
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def signatures(paper):
+    """{kind: MinHash signature} of the title and the abstract."""
+    result = {}
+    for kind, text in (("title", paper.get("title")), ("abstract", paper.get("abstract"))):
+        signature = minhash(shingles(text, kind))
+        if signature is not None:
+            result[kind] = signature
+    return result
+
+
+def band_hashes(signature):
+    """One signed 64-bit hash per LSH band of `signature`."""
+    return [
+        int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), "big", signed=True)
+        for band in np.split(signature, n_bands)
+    ]
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(signature == other))
+
+
+# 3. DedupIndex
+class DedupIndex:
+    """SQLite-backed exact and MinHash/LSH index of papers, keyed by pmid."""
+
+    def __init__(self, path=default_path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS dedup_keys (
+                key TEXT PRIMARY KEY,
+                pmid INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS dedup_signatures (
+                pmid INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                PRIMARY KEY (pmid, kind)
+            );
+            CREATE TABLE IF NOT EXISTS dedup_bands (
+                kind TEXT NOT NULL,
+                band INTEGER NOT NULL,
+                hash INTEGER NOT NULL,
+                pmid INTEGER NOT NULL,
+                PRIMARY KEY (kind, band, hash, pmid)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS dedup_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """
+        )
+        # signatures of other permutations cannot be compared with new ones
+        # (the database is shared with other stores: no PRAGMA user_version)
+        row = self.connection.execute(
+            "SELECT value FROM dedup_meta WHERE key = 'signature_version'"
+        ).fetchone()
+        if row is None or row[0] != signature_version:
+            with self.connection:
+                n_dropped = self.connection.execute("DELETE FROM dedup_signatures").rowcount
+                self.connection.execute("DELETE FROM dedup_bands")
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO dedup_meta VALUES ('signature_version', ?)",
+                    (signature_version,),
+                )
+            if n_dropped:
+                logging.warning(
+                    f"Dropped {n_dropped} MinHash signatures of an older version, "
+                    "exact DOI/title keys are kept"
+                )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute(
+            "SELECT COUNT(DISTINCT pmid) FROM dedup_keys"
+        ).fetchone()[0]
+
+    def add(self, papers, paper_signatures=None):
+        """Index `papers` (with their `signatures`, if already computed). A
+        key already taken keeps its first paper."""
+        key_rows, signature_rows, band_rows = [], [], []
+        if paper_signatures is None:
+            paper_signatures = [signatures(paper) for paper in papers]
+        for paper, paper_signature in zip(papers, paper_signatures):
+            pmid = int(paper["pmid"])
+            key_rows += [(key, pmid) for key in exact_keys(paper)]
+            for kind, signature in paper_signature.items():
+                signature_rows.append((pmid, kind, signature.tobytes()))
+                band_rows += [
+                    (kind, band, hash_, pmid) for band, hash_ in enumerate(band_hashes(signature))
+                ]
+        with self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO dedup_keys VALUES (?, ?)", key_rows)
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO dedup_signatures VALUES (?, ?, ?)", signature_rows
+            )
+            self.connection.executemany("INSERT OR IGNORE INTO dedup_bands VALUES (?, ?, ?, ?)", band_rows)
+
+    def _signature(self, pmid, kind):
+        row = self.connection.execute(
+            "SELECT signature FROM dedup_signatures WHERE pmid = ? AND kind = ?", (pmid, kind)
+        ).fetchone()
+        return np.frombuffer(row[0], dtype=np.uint32) if row else None
+
+    def find(self, paper, paper_signatures=None):
+        """PMID of an indexed paper that `paper` duplicates (other than
+        itself), or None."""
+        pmid = int(paper["pmid"])
+        for key in exact_keys(paper):
+            row = self.connection.execute(
+                "SELECT pmid FROM dedup_keys WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[0] != pmid:
+                return row[0]
+        if paper_signatures is None:
+            paper_signatures = signatures(paper)
+        for kind, signature in paper_signatures.items():
+            candidates = set()
+            for band, hash_ in enumerate(band_hashes(signature)):
+                candidates.update(
+                    row[0]
+                    for row in self.connection.execute(
+                        "SELECT pmid FROM dedup_bands WHERE kind = ? AND band = ? AND hash = ?",
+                        (kind, band, hash_),
+                    )
+                )
+            candidates.discard(pmid)
+            for candidate in sorted(candidates):
+                other = self._signature(candidate, kind)
+                if other is not None and similarity(signature, other) >= thresholds[kind]:
+                    return candidate
+        return None
+
+    def deduplicate(self, papers, prefer_source="pubmed", batch=None):
+        """
+        Split `papers` into (kept, duplicates). A paper is a duplicate if it
+        matches an indexed paper, or another paper of the batch; within the
+        batch, papers of `prefer_source` (journal versions) are kept over
+        the others (preprints). `duplicates` is a list of
+        (paper, pmid of the paper it duplicates).
+
+        `batch` is the in-memory index of the papers kept so far, to
+        deduplicate successive batches of one run against each other
+        (the caller closes it); by default a temporary one.
+        """
+        # the batch is checked through an in-memory index
+        temporary = batch is None
+        if temporary:
+            batch = DedupIndex(":memory:")
+        ordered = sorted(papers, key=lambda p: p.get("source", prefer_source) != prefer_source)
+        kept, duplicates = [], []
+        try:
+            seen = set()
+            for paper in ordered:
+                if int(paper["pmid"]) in seen:
+                    duplicates.append((paper, int(paper["pmid"])))
+                    continue
+                seen.add(int(paper["pmid"]))
+                paper_signatures = signatures(paper)
+                duplicate_of = self.find(paper, paper_signatures)
+                if duplicate_of is None:
+                    duplicate_of = batch.find(paper, paper_signatures)
+                if duplicate_of is None:
+                    kept.append(paper)
+                    batch.add([paper], [paper_signatures])
+                else:
+                    duplicates.append((paper, duplicate_of))
+        finally:
+            if temporary:
+                batch.close()
+        # keep the input order
+        kept_ids = {id(paper) for paper in kept}
+        kept = [paper for paper in papers if id(paper) in kept_ids]
+        logging.info(f"Dedup: {len(kept)} kept, {len(duplicates)} duplicates")
+        return kept, duplicates
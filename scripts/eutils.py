@@ -0,0 +1,266 @@
+"""E-utilities
+
+Shared asyncio client for the NCBI E-utilities (esearch, efetch, elink).
+
+All requests go through one pooled keep-alive aiohttp session and a token
+bucket that keeps us under NCBI's limit of 3 requests/s (10 requests/s with
+an API key, read from the NCBI_API_KEY environment variable). 429 and 5xx
+responses are retried with exponential backoff, and each of them also halves
+the request rate, which then recovers step by step on successful requests.
+When a request still fails after all retries an EUtilsError is raised, so a
+failed call can no longer pass for an empty result.
+
+Structure:
+    1. Imports, Variables
+    2. Rate Limiting and Retries
+    3. Client
+"""
+# 1. Imports, Variables
+# imports
+import asyncio
+import logging
+import os
+import time
+
+import aiohttp
+
+import instrumentation
+
+# variables
+base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+default_rate = 3.0  # requests/s allowed without an API key
+api_key_rate = 10.0  # requests/s allowed with an API key
+retry_statuses = {429, 500, 502, 503, 504}
+max_retry_delay = 300  # seconds, cap of Retry-After and backoff delays
+
+
+class EUtilsError(Exception):
+    """Raised when an E-utilities request fails after all retries."""
+
+
+# 2. Rate Limiting and Retries
+class TokenBucket:
+    """Token bucket shared by every request of a client.
+
+    `capacity` is kept at 1 by default so requests are evenly spaced:
+    NCBI counts bursts, not averages. `throttle` and `recover` adapt the
+    rate (multiplicative decrease, additive increase) between
+    `min_rate` and the configured `max_rate`.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.max_rate = rate
+        self.min_rate = rate / 8
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # created on first use, on the loop that runs the requests (before
+        # Python 3.10, a lock is bound to the loop current at its creation)
+        self.lock = None
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def throttle(self):
+        """Halve the rate after a 429/5xx response."""
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self):
+        """Step the rate back up after a successful response."""
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+async def retrying_send(
+    client,
+    api,
+    send,
+    error_class,
+    bucket=None,
+    ok_statuses=(200,),
+    statuses=retry_statuses,
+    retry_errors=True,
+):
+    """
+    Call the coroutine function `send()`, which sends one request and
+    returns (HTTP status, Retry-After header or None, result), until its
+    status is in `ok_statuses`, and return the result. `client` is an object
+    with `max_retries`, `backoff` and `n_requests`; every attempt waits for
+    a token of `bucket` (default: the client's) and is recorded as a
+    request of `api` (see instrumentation.py). `statuses` are retried with
+    exponential backoff (or the Retry-After delay, capped at
+    `max_retry_delay`), and so are network errors if `retry_errors`; other
+    statuses fail at once. Raises `error_class` when the request fails.
+    """
+    bucket = bucket or client.bucket
+    for attempt in range(client.max_retries + 1):
+        await bucket.acquire()
+        client.n_requests += 1
+        retry_after = None
+        started = time.perf_counter()
+        try:
+            status, retry_after, result = await send()
+            if status in ok_statuses:
+                bucket.recover()
+                instrumentation.record_request(api, time.perf_counter() - started)
+                return result
+            instrumentation.record_request(api, time.perf_counter() - started, ok=False)
+            if status not in statuses:
+                raise error_class(f"{api} failed: HTTP {status}")
+            reason = f"HTTP {status}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            instrumentation.record_request(api, time.perf_counter() - started, ok=False)
+            if not retry_errors:
+                raise error_class(f"{api} failed: {e!r}") from e
+            reason = repr(e)
+
+        if attempt == client.max_retries:
+            break
+        bucket.throttle()
+        if retry_after is not None and retry_after.isdigit():
+            delay = float(retry_after)
+        else:
+            delay = client.backoff * 2**attempt
+        delay = min(delay, max_retry_delay)
+        logging.warning(f"{api} {reason}, retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    raise error_class(f"{api} failed after {client.max_retries} retries: {reason}")
+
+
+async def retrying_request(client, api, method, url, read, error_class, **kwargs):
+    """
+    Send a request through `client` (an object with `session`, `bucket`,
+    `max_retries`, `backoff` and `n_requests`) with `retrying_send`, and
+    return its body, read by the coroutine function `read(response)`.
+    """
+
+    async def send():
+        async with client.session.request(method, url, **kwargs) as response:
+            if response.status != 200:
+                return response.status, response.headers.get("Retry-After"), None
+            return response.status, None, await read(response)
+
+    return await retrying_send(client, api, send, error_class)
+
+
+# 3. Client
+class EUtilsClient:
+    """Async E-utilities client, to be used as an async context manager.
+
+    >>> async with EUtilsClient() as client:
+    ...     content = await client.esearch(db="pubmed", term="...")
+    """
+
+    def __init__(
+        self,
+        api_key=None,
+        rate=None,
+        max_retries=5,
+        backoff=1.0,
+        max_connections=10,
+        timeout=120,
+        base_url=base_url,
+        bucket=None,
+    ):
+        self.api_key = api_key or os.getenv("NCBI_API_KEY")
+        if rate is None:
+            rate = api_key_rate if self.api_key else default_rate
+        # clients of one event loop can share a bucket to stay under the
+        # rate limit together
+        self.bucket = bucket or TokenBucket(rate)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.base_url = base_url
+        self.n_requests = 0  # HTTP requests sent, retries included
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def request(self, utility, params, method="GET"):
+        """
+        Send a request to `utility` ("esearch", "efetch", "elink") and return
+        the response body. `params` is a dict or a list of (key, value) pairs;
+        use a list to repeat a key. POST sends the parameters as form data.
+        """
+        params = list(params.items()) if isinstance(params, dict) else list(params)
+        if self.api_key:
+            params.append(("api_key", self.api_key))
+        url = f"{self.base_url}{utility}.fcgi"
+        if method == "POST":
+            kwargs = {"data": params}
+        else:
+            kwargs = {"params": params}
+        return await retrying_request(
+            self, utility, method, url, lambda response: response.read(), EUtilsError, **kwargs
+        )
+
+    async def esearch(self, **params):
+        return await self.request("esearch", params)
+
+    async def efetch(self, **params):
+        return await self.request("efetch", params)
+
+    async def elink(self, params, method="POST"):
+        return await self.request("elink", params, method=method)
+
+
+def run(coro_fn, *args, **kwargs):
+    """
+    Run `coro_fn(client, *args, **kwargs)` with a fresh client on a new
+    event loop. Used by the synchronous wrappers in pubmed.py and
+    citations.py.
+    """
+
+    async def main():
+        async with EUtilsClient() as client:
+            return await coro_fn(client, *args, **kwargs)
+
+    return asyncio.run(main())
+
+
+def iterate(agen_fn, *args, **kwargs):
+    """
+    Synchronous generator over the async generator
+    `agen_fn(client, *args, **kwargs)`, run with a fresh client on a private
+    event loop that lives as long as the generator.
+    """
+    loop = asyncio.new_event_loop()
+    client = EUtilsClient()
+    try:
+        loop.run_until_complete(client.__aenter__())
+        agen = agen_fn(client, *args, **kwargs)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(agen.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(agen.aclose())
+    finally:
+        loop.run_until_complete(client.__aexit__(None, None, None))
+        loop.close()
@@ -0,0 +1,140 @@
+"""Extractive
+
+Extractive summarization: the summary of an abstract is its most central
+sentence that fits in the tweet, instead of a BART generation. It costs a
+sentence split and a few array operations per abstract, no model.
+
+Scoring, for all sentences of all abstracts at once:
+    - sentences become hashed, IDF-weighted bag-of-words vectors (kept as
+      coordinate arrays, like relevance.py),
+    - each sentence is scored by its cosine similarity to its abstract's
+      centroid (the sum of the abstract's sentence vectors), plus a small
+      bonus for contribution cues ("we propose", "here we", ...),
+    - the best sentence whose weighted length fits the tweet's summary
+      budget (tweet_render.summary_budgets) and is at least
+      `min_abstract_length` long is picked.
+A pick is "confident" when its score reaches `min_confidence` and it does
+not open with an anaphora ("This", "However", ...) that needs the previous
+sentence; in hybrid mode only the other abstracts go to BART.
+
+Modes (reader.py `summarizer_mode`):
+    - "abstractive": BART for every abstract (the previous behavior),
+    - "extractive": extractive summaries only,
+    - "hybrid": extractive when confident, BART otherwise.
+
+Structure:
+    1. Imports, Variables
+    2. Sentence Vectors
+    3. Extraction
+"""
+# 1. Imports, Variables
+# imports
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from relevance import stop_words
+from sentences import load_segmenter
+from tweet_render import min_abstract_length, weighted_length
+
+# variables
+summarizer_modes = ("abstractive", "extractive", "hybrid")
+n_features = 2**18  # hashed vocabulary size
+min_confidence = 0.45  # centroid similarity of a confident pick
+cue_bonus = 0.1
+cue_pattern = re.compile(
+    r"\b(we (propose|present|develop|introduce|show|describe|demonstrate)|here,? we|"
+    r"this (study|work|paper)|our (results|method|approach|findings))\b",
+    re.IGNORECASE,
+)
+anaphora_pattern = re.compile(
+    r"^(this|these|those|it|they|however|moreover|furthermore|additionally|thus|"
+    r"therefore|finally|then|such|in addition|in contrast)\b",
+    re.IGNORECASE,
+)
+
+
+# 2. Sentence Vectors
+def split_sentences(abstracts, batch_size=256):
+    """Sentences of every abstract (None -> []), in one batched spaCy pass."""
+    sentences = [[] for _ in abstracts]
+    positions = [i for i, abstract in enumerate(abstracts) if isinstance(abstract, str) and abstract]
+    docs = load_segmenter().pipe((abstracts[i] for i in positions), batch_size=batch_size)
+    for i, doc in zip(positions, docs):
+        sentences[i] = [sentence.text.strip() for sentence in doc.sents if sentence.text.strip()]
+    return sentences
+
+
+def centroid_scores(sentence_words, groups):
+    """
+    Cosine similarity of every sentence (list of words) to the centroid of
+    its group (abstract index, non-decreasing), as an array.
+    """
+    n_sentences = len(sentence_words)
+    rows = np.repeat(np.arange(n_sentences), [len(words) for words in sentence_words])
+    features = np.fromiter(
+        (zlib.crc32(word.encode()) % n_features for words in sentence_words for word in words),
+        dtype=np.int64,
+        count=len(rows),
+    )
+    if not len(rows):
+        return np.zeros(n_sentences)
+    # term frequencies: one entry per (sentence, feature)
+    keys, counts = np.unique(rows * n_features + features, return_counts=True)
+    rows, features = keys // n_features, keys % n_features
+    document_frequency = np.bincount(features, minlength=n_features)
+    idf = np.log((1 + n_sentences) / (1 + document_frequency[features])) + 1
+    weights = (1 + np.log(counts)) * idf
+    norms = np.sqrt(np.bincount(rows, weights=weights**2, minlength=n_sentences))
+    weights = weights / np.maximum(norms, 1e-12)[rows]
+
+    # centroids: sum of the normalized sentence vectors of each group
+    group_keys = groups[rows] * n_features + features
+    centroid_keys, inverse = np.unique(group_keys, return_inverse=True)
+    centroid_weights = np.bincount(inverse, weights=weights)
+    centroid_groups = centroid_keys // n_features
+    centroid_norms = np.sqrt(
+        np.bincount(centroid_groups, weights=centroid_weights**2, minlength=groups.max() + 1)
+    )
+    dots = np.bincount(rows, weights=weights * centroid_weights[inverse], minlength=n_sentences)
+    return dots / np.maximum(centroid_norms[groups], 1e-12)
+
+
+# 3. Extraction
+def extract_summaries(abstracts, budgets, min_confidence=min_confidence):
+    """
+    Return (summaries, confident): the extracted sentence of every
+    abstract (None when there is no abstract), and a boolean array of the
+    confident picks. `budgets` is the weighted length available for each
+    summary; when no sentence fits, the best one is returned anyway (not
+    confident), to be truncated by the renderer.
+    """
+    abstracts = list(abstracts)
+    budgets = np.asarray(budgets)
+    summaries = [None] * len(abstracts)
+    confident = np.zeros(len(abstracts), dtype=bool)
+    sentences = split_sentences(abstracts)
+    groups = np.repeat(np.arange(len(abstracts)), [len(s) for s in sentences])
+    flat = [sentence for abstract_sentences in sentences for sentence in abstract_sentences]
+    if not flat:
+        return summaries, confident
+
+    words = [
+        [word for word in re.findall(r"[a-z0-9][a-z0-9\-]+", sentence.lower()) if word not in stop_words]
+        for sentence in flat
+    ]
+    scores = centroid_scores(words, groups)
+    scores += cue_bonus * np.array([bool(cue_pattern.search(s)) for s in flat])
+    lengths = weighted_length(pd.Series(flat))
+    fits = (lengths >= min_abstract_length) & (lengths <= budgets[groups])
+
+    order = np.lexsort((-scores, ~fits, groups))  # by group, fitting first, best first
+    first = order[np.r_[True, groups[order][1:] != groups[order][:-1]]]
+    anaphoric = np.array([bool(anaphora_pattern.match(flat[i])) for i in first])
+    for i, is_anaphoric in zip(first, anaphoric):
+        group = groups[i]
+        summaries[group] = flat[i]
+        confident[group] = fits[i] and scores[i] >= min_confidence and not is_anaphoric
+    return summaries, confident
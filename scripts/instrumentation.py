@@ -0,0 +1,315 @@
+"""Instrumentation
+
+Per-stage metrics of the reader and the writer, written as a JSON report
+per run and, optionally, as a Prometheus text-format file (for the node
+exporter's textfile collector).
+
+Each stage records:
+    - wall time and CPU time (of the process and of finished child
+      processes, e.g. summarization workers),
+    - peak RSS, and blocks read/written on disk,
+    - HTTP requests per API, with errors and latency percentiles (reported
+      by the E-utilities client and the writer's posts),
+    - items in and out, and stage-specific values such as cache hit rates.
+Together they tell whether a slow run was spent waiting on NCBI, in BART or
+on disk.
+
+The hot loop of the summarization can also be profiled with cProfile
+(`profiled`), the stats being saved next to the report.
+
+    >>> run = Run("reader")
+    >>> with run.stage("fetch") as stage:
+    ...     papers = fetch()
+    ...     stage.items_out = len(papers)
+    >>> run.write()
+
+Structure:
+    1. Imports, Variables
+    2. Stage Metrics
+    3. Run
+    4. Profiling
+"""
+# 1. Imports, Variables
+# imports
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# variables
+default_report_dir = os.path.join("..", "results", "reports")
+percentiles = (50, 90, 99)
+_current = None  # stage being measured, if any
+
+
+# 2. Stage Metrics
+def _usage():
+    """(cpu seconds self, cpu seconds children, peak RSS bytes, blocks in,
+    blocks out), zeros where resource is not available."""
+    if resource is None:
+        return time.process_time(), 0.0, 0, 0, 0
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    return (
+        own.ru_utime + own.ru_stime,
+        children.ru_utime + children.ru_stime,
+        max(own.ru_maxrss, children.ru_maxrss) * rss_unit,
+        own.ru_inblock + children.ru_inblock,
+        own.ru_oublock + children.ru_oublock,
+    )
+
+
+def current_rss():
+    """Current resident set size in bytes (not the peak), None where
+    /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def percentile(values, q):
+    """q-th percentile of `values` (nearest rank)."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(int(round(q / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class StageMetrics:
+    """Metrics of one stage. Stage code sets `items_in`, `items_out` and
+    any extra value in `values`."""
+
+    def __init__(self, name, items_in=None):
+        self.name = name
+        self.items_in = items_in
+        self.items_out = None
+        self.values = {}
+        self.requests = {}  # api -> list of (seconds, ok)
+        self.failed = False
+
+    def record_request(self, api, seconds, ok=True):
+        self.requests.setdefault(api, []).append((seconds, ok))
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._usage = _usage()
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        cpu, cpu_children, self.peak_rss, blocks_in, blocks_out = _usage()
+        self.wall_seconds = time.perf_counter() - self._wall
+        self.cpu_seconds = cpu - self._usage[0]
+        self.cpu_children_seconds = cpu_children - self._usage[1]
+        self.disk_blocks_read = blocks_in - self._usage[3]
+        self.disk_blocks_written = blocks_out - self._usage[4]
+        self.failed = exc_type is not None
+
+    def to_dict(self):
+        requests = {}
+        for api, calls in self.requests.items():
+            latencies = [seconds for seconds, _ in calls]
+            requests[api] = {
+                "count": len(calls),
+                "errors": sum(not ok for _, ok in calls),
+                "seconds": round(sum(latencies), 6),
+                **{f"p{q}": round(percentile(latencies, q), 6) for q in percentiles},
+            }
+        return {
+            "stage": self.name,
+            "failed": self.failed,
+            "wall_seconds": round(self.wall_seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+            "cpu_children_seconds": round(self.cpu_children_seconds, 6),
+            "peak_rss_bytes": self.peak_rss,
+            "disk_blocks_read": self.disk_blocks_read,
+            "disk_blocks_written": self.disk_blocks_written,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "requests": requests,
+            **self.values,
+        }
+
+
+def current():
+    """The stage being measured, or None."""
+    return _current
+
+
+def record_request(api, seconds, ok=True):
+    """Record an HTTP request in the current stage, if any."""
+    if _current is not None:
+        _current.record_request(api, seconds, ok)
+
+
+def record(name, value):
+    """Record an extra value (e.g. a cache hit rate) in the current stage."""
+    if _current is not None:
+        _current.values[name] = value
+
+
+def record_hit_rate(name, hits, lookups):
+    """Add `hits` out of `lookups` to the `{name}_hits` and `{name}_lookups`
+    of the current stage, and record their `{name}_hit_rate`: a stage that
+    looks up its cache batch by batch (pipelined runs) reports the rate of
+    all its batches."""
+    if _current is not None:
+        values = _current.values
+        values[f"{name}_hits"] = values.get(f"{name}_hits", 0) + hits
+        values[f"{name}_lookups"] = values.get(f"{name}_lookups", 0) + lookups
+        total = values[f"{name}_lookups"]
+        values[f"{name}_hit_rate"] = values[f"{name}_hits"] / total if total else 0.0
+
+
+# 3. Run
+class Run:
+    """Metrics of one reader run, or of a writer process."""
+
+    def __init__(self, name, report_dir=default_report_dir, prometheus_path=None):
+        self.name = name
+        self.report_dir = report_dir
+        self.prometheus_path = prometheus_path
+        self.started = time.time()
+        self.stages = []
+
+    @contextlib.contextmanager
+    def stage(self, name, items_in=None):
+        """Measure the enclosed code as stage `name`."""
+        global _current
+        metrics = StageMetrics(name, items_in)
+        previous, _current = _current, metrics
+        try:
+            with metrics:
+                yield metrics
+        finally:
+            _current = previous
+            self.stages.append(metrics)
+            logging.info(
+                f"{name}: {metrics.wall_seconds:.2f}s wall, {metrics.cpu_seconds:.2f}s CPU, "
+                f"{metrics.items_in} -> {metrics.items_out} items"
+            )
+
+    def to_dict(self):
+        return {
+            "run": self.name,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "pid": os.getpid(),
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+    def report_path(self):
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        return os.path.join(self.report_dir, f"{self.name}-{stamp}.json")
+
+    def write(self):
+        """Write the JSON report (and the Prometheus file, if configured).
+        Can be called repeatedly, e.g. after each tweet: the files are
+        rewritten."""
+        os.makedirs(self.report_dir, exist_ok=True)
+        path = self.report_path()
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        if self.prometheus_path:
+            write_atomic(self.prometheus_path, self.to_prometheus())
+        return path
+
+    def to_prometheus(self):
+        """Metrics of the latest occurrence of each stage, in the Prometheus
+        text format."""
+        latest = {stage.name: stage for stage in self.stages}
+        prefix = f"goodreader_{self.name}"
+        gauges = {
+            "stage_wall_seconds": ("Wall time of the stage.", "wall_seconds"),
+            "stage_cpu_seconds": ("CPU time of the stage.", "cpu_seconds"),
+            "stage_cpu_children_seconds": ("CPU time of finished child processes.", "cpu_children_seconds"),
+            "stage_peak_rss_bytes": ("Peak resident set size at the end of the stage.", "peak_rss_bytes"),
+            "stage_disk_blocks_read": ("Blocks read from disk.", "disk_blocks_read"),
+            "stage_disk_blocks_written": ("Blocks written to disk.", "disk_blocks_written"),
+            "stage_items_in": ("Items entering the stage.", "items_in"),
+            "stage_items_out": ("Items leaving the stage.", "items_out"),
+            "stage_failed": ("1 if the stage raised.", "failed"),
+        }
+        lines = []
+        dicts = {name: stage.to_dict() for name, stage in latest.items()}
+        for metric, (help_text, key) in gauges.items():
+            lines += [f"# HELP {prefix}_{metric} {help_text}", f"# TYPE {prefix}_{metric} gauge"]
+            for name, values in dicts.items():
+                if values[key] is not None:
+                    lines.append(f'{prefix}_{metric}{{stage="{name}"}} {float(values[key])}')
+        for metric, help_text, key in (
+            ("http_requests", "HTTP requests of the stage, retries included.", "count"),
+            ("http_errors", "Failed HTTP requests of the stage.", "errors"),
+        ):
+            lines += [f"# HELP {prefix}_{metric} {help_text}", f"# TYPE {prefix}_{metric} gauge"]
+            for name, values in dicts.items():
+                for api, stats in values["requests"].items():
+                    lines.append(f'{prefix}_{metric}{{stage="{name}",api="{api}"}} {stats[key]}')
+        lines += [
+            f"# HELP {prefix}_http_latency_seconds HTTP latency percentiles of the stage.",
+            f"# TYPE {prefix}_http_latency_seconds gauge",
+        ]
+        for name, values in dicts.items():
+            for api, stats in values["requests"].items():
+                for q in percentiles:
+                    lines.append(
+                        f'{prefix}_http_latency_seconds{{stage="{name}",api="{api}",quantile="{q / 100}"}} {stats[f"p{q}"]}'
+                    )
+        # stage-specific values, e.g. cache hit rates
+        for name, stage in latest.items():
+            for key, value in stage.values.items():
+                if isinstance(value, (int, float)):
+                    lines.append(f'{prefix}_{key}{{stage="{name}"}} {float(value)}')
+        return "\n".join(lines) + "\n"
+
+
+def write_atomic(path, text):
+    """Write `text` to `path` through a temporary file, so scrapers never
+    read a half-written file."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# 4. Profiling
+@contextlib.contextmanager
+def profiled(enabled, path, n_lines=25):
+    """cProfile the enclosed code when `enabled`: the stats are saved to
+    `path` (open with `python -m pstats` or snakeviz) and the top
+    `n_lines` functions by cumulative time are logged. For a sampling
+    profile of a running process, py-spy can be attached instead:
+    `py-spy record --pid <pid>`."""
+    if not enabled:
+        yield
+        return
+    import cProfile
+    import io
+    import pstats
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        profile.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(n_lines)
+        logging.info(f"Profile saved in {path}\n{out.getvalue()}")
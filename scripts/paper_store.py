@@ -0,0 +1,150 @@
+"""Paper Store
+
+Columnar, append-only store of the papers to tweet, replacing
+results/papers_to_tweet.csv.
+
+Papers are kept as a Parquet dataset with typed columns (pmid and citations
+are integers, keywords a real list column). Each reader run appends its own
+partition file instead of rewriting the whole table, and readers only load
+the columns they ask for (e.g. `writer_columns`, without the full
+abstracts). When a PMID is exported by several runs, the row of the latest
+partition wins.
+
+Usage:
+    python paper_store.py --import-csv ../results/papers_to_tweet.csv
+    python paper_store.py --compact
+
+Structure:
+    1. Imports, Variables
+    2. PaperStore
+    3. Main
+"""
+# 1. Imports, Variables
+# imports
+import argparse
+import ast
+import glob
+import logging
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# variables
+default_path = os.path.join("..", "results", "papers")
+schema = pa.schema(
+    [
+        ("title", pa.string()),
+        ("pmid", pa.int64()),
+        ("link", pa.string()),
+        ("doi_link", pa.string()),
+        ("keywords", pa.list_(pa.string())),
+        ("abstract", pa.string()),
+        ("citations", pa.int64()),
+        ("abstract_summary", pa.string()),
+        ("tweet_text", pa.string()),
+        ("source", pa.string()),  # null in partitions written before sources
+    ]
+)
+writer_columns = ["pmid", "title", "doi_link", "abstract_summary", "tweet_text"]
+
+
+# 2. PaperStore
+class PaperStore:
+    """Directory of Parquet partitions, one per append."""
+
+    def __init__(self, path=default_path):
+        self.path = path
+
+    def partitions(self):
+        """Partition files, oldest first."""
+        return sorted(glob.glob(os.path.join(self.path, "*.parquet")))
+
+    def append(self, papers):
+        """Write `papers` (dicts, as produced by the reader) as a new
+        partition. Returns the partition path, or None if there is nothing
+        to write."""
+        if not papers:
+            return None
+        table = pa.Table.from_pylist(
+            [
+                {
+                    name: int(paper[name])
+                    if name in ("pmid", "citations") and paper.get(name) is not None
+                    else paper.get(name)
+                    for name in schema.names
+                }
+                for paper in papers
+            ],
+            schema=schema,
+        )
+        os.makedirs(self.path, exist_ok=True)
+        # time_ns keeps partition names unique and in append order
+        partition = os.path.join(self.path, f"run-{time.time_ns()}.parquet")
+        pq.write_table(table, partition)
+        return partition
+
+    def read_table(self, columns=None):
+        """Read `columns` (all by default) of every partition as an Arrow
+        table, keeping only the latest row of each PMID."""
+        partitions = self.partitions()
+        if not partitions:
+            return schema.empty_table().select(columns or schema.names)
+        read_columns = list(columns or schema.names)
+        if "pmid" not in read_columns:
+            read_columns.append("pmid")
+        table = pa.concat_tables(
+            pq.read_table(partition, columns=read_columns, schema=schema)
+            for partition in partitions
+        )
+        # latest row per PMID: scan from the end, keep first occurrences
+        pmids = table.column("pmid").to_pylist()
+        seen, keep = set(), []
+        for i in range(len(pmids) - 1, -1, -1):
+            if pmids[i] not in seen:
+                seen.add(pmids[i])
+                keep.append(i)
+        table = table.take(sorted(keep))
+        return table.select(columns or schema.names)
+
+    def read(self, columns=None):
+        """Same as read_table, as a pandas DataFrame."""
+        return self.read_table(columns).to_pandas()
+
+    def compact(self):
+        """Rewrite all partitions as a single one, dropping superseded rows."""
+        partitions = self.partitions()
+        if len(partitions) < 2:
+            return
+        table = self.read_table()
+        partition = os.path.join(self.path, f"run-{time.time_ns()}.parquet")
+        pq.write_table(table, partition)
+        for old in partitions:
+            os.remove(old)
+        logging.info(f"Compacted {len(partitions)} partitions into {partition}")
+
+    def import_csv(self, path_csv):
+        """Append the papers of a papers_to_tweet.csv file."""
+        import pandas as pd
+
+        df_papers = pd.read_csv(path_csv)
+        df_papers["keywords"] = df_papers["keywords"].apply(ast.literal_eval)
+        df_papers = df_papers.astype(object).where(df_papers.notna(), None)
+        return self.append(df_papers.to_dict("records"))
+
+
+# 3. Main
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Maintain the paper store.")
+    parser.add_argument("--path", default=default_path)
+    parser.add_argument("--import-csv", help="append the papers of a CSV file")
+    parser.add_argument("--compact", action="store_true", help="merge partitions")
+    args = parser.parse_args()
+
+    store = PaperStore(args.path)
+    if args.import_csv:
+        logging.info(f"Imported {args.import_csv} into {store.import_csv(args.import_csv)}")
+    if args.compact:
+        store.compact()
@@ -0,0 +1,112 @@
+"""Pipeline
+
+Pipelined execution of batch stages: each stage consumes the batches of
+the previous one from a bounded queue and runs concurrently with the
+others, so network-bound stages (fetching, citation lookups) overlap with
+CPU-bound ones (summarization) instead of running one after the other.
+The wall time of a run approaches that of its slowest stage rather than
+the sum of all stages.
+
+    batches -> [queue] -> step 1 -> [queue] -> step 2 -> ... -> results
+
+A step is a (name, function) pair taking and returning a list of papers:
+    - coroutine functions run on the event loop (e.g. requests through a
+      client shared with the source),
+    - plain functions run in a thread of their own (one per step, so a
+      step never runs twice at once and its thread-bound resources, e.g. a
+      model, stay on one thread). Torch, SQLite and NumPy release the GIL,
+      so they do not hold up the event loop.
+Queues hold at most `max_queued` batches: a slow step makes the steps
+before it wait (backpressure) instead of buffering the whole run. If a step
+fails, the other steps are cancelled and its error is raised.
+
+    >>> papers, stats = asyncio.run(run_pipeline(batched(papers_iter, 50), steps))
+
+Structure:
+    1. Imports, Variables
+    2. Batching
+    3. Pipeline
+"""
+# 1. Imports, Variables
+# imports
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# variables
+_done = object()  # end of stream marker
+
+
+# 2. Batching
+async def batched(papers, size):
+    """Lists of up to `size` papers from the async iterable `papers`."""
+    batch = []
+    async for paper in papers:
+        batch.append(paper)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# 3. Pipeline
+async def run_pipeline(batches, steps, max_queued=2):
+    """
+    Run `steps` over the async iterable `batches`, all concurrently, and
+    return (papers out of the last step, stats). `stats` maps each step to
+    its busy seconds and items in/out, plus `wall_seconds` for the whole
+    pipeline. Batches left empty by a step are not passed on.
+    """
+    queues = [asyncio.Queue(maxsize=max_queued) for _ in steps]
+    stats = {name: {"seconds": 0.0, "items_in": 0, "items_out": 0} for name, _ in steps}
+    executors = {
+        name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"pipeline-{name}")
+        for name, function in steps
+        if not asyncio.iscoroutinefunction(function)
+    }
+    results = []
+    loop = asyncio.get_running_loop()
+
+    async def feed():
+        async for batch in batches:
+            await queues[0].put(batch)
+        await queues[0].put(_done)
+
+    async def work(i, name, function):
+        while True:
+            batch = await queues[i].get()
+            if batch is _done:
+                if i + 1 < len(steps):
+                    await queues[i + 1].put(_done)
+                return
+            start = time.perf_counter()
+            stats[name]["items_in"] += len(batch)
+            if name in executors:
+                batch = await loop.run_in_executor(executors[name], function, batch)
+            else:
+                batch = await function(batch)
+            stats[name]["seconds"] += time.perf_counter() - start
+            stats[name]["items_out"] += len(batch)
+            if not batch:
+                continue
+            if i + 1 < len(steps):
+                await queues[i + 1].put(batch)
+            else:
+                results.extend(batch)
+
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(feed())] + [
+        asyncio.create_task(work(i, name, function)) for i, (name, function) in enumerate(steps)
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # a step still running in its thread is waited for, not interrupted
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+    stats["wall_seconds"] = time.perf_counter() - start
+    return results, stats
@@ -0,0 +1,334 @@
+"""Publisher
+
+Publishes the writer's papers to several channels at once: X accounts,
+Mastodon and Bluesky, each behind the same small `Channel` interface.
+
+Every post of a paper is fanned out concurrently, so a slow or failing
+API does not hold up the others. Each channel has:
+    - its own token bucket (eutils.TokenBucket: posts/s, halved after a
+      429/5xx response and stepped back up after a success),
+    - retries with exponential backoff (or the server's Retry-After), the
+      same loop as the E-utilities client (eutils.retrying_send): on
+      429/5xx responses and network errors for channels whose posts are
+      idempotent (Mastodon's Idempotency-Key), only on 429/503 (the post
+      was not taken) for the others, where a post whose response was lost
+      may have gone out; other HTTP errors (401, 403 duplicate content,
+      422, ...) fail at once,
+    - its own delivery state, kept by the writer in the tweet queue
+      (TweetQueue.record_delivery): a paper posted on some channels only
+      is retried on the others at the next slots,
+    - its own length limit (`max_length`, with links counted as
+      `url_length` characters, or their real length if None): X's text is
+      the one rendered by the reader, the others are rendered for their
+      limit (tweet_render) when published.
+
+The channels use plain aiohttp requests (OAuth 1.0a user context for X,
+bearer tokens for Mastodon, an app password session for Bluesky), so
+each can be pointed at a local stand-in (stand_in_channels.py) through its
+`base_url`.
+
+    >>> channels = [XChannel("x"), MastodonChannel("mastodon", "https://mastodon.social/")]
+    >>> results = asyncio.run(publish_all(channels, [(paper, ["x", "mastodon"])]))
+    >>> # [{"x": ("1790...", None), "mastodon": (None, "mastodon failed: HTTP 401")}]
+
+Structure:
+    1. Imports, Variables
+    2. Channels
+    3. Publisher
+"""
+# 1. Imports, Variables
+# imports
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import time
+import urllib.parse
+
+import aiohttp
+
+from eutils import TokenBucket, retry_statuses, retrying_send
+
+# variables
+not_taken_statuses = {429, 503}  # statuses of a post that did not go out
+
+
+class PublishError(Exception):
+    """Raised when a post fails on a channel after all retries."""
+
+
+# 2. Channels
+def oauth1_header(method, url, consumer_key, consumer_secret, token, token_secret):
+    """OAuth 1.0a (HMAC-SHA1) Authorization header of a request without
+    query or form parameters (e.g. a JSON POST)."""
+    quote = lambda value: urllib.parse.quote(value, safe="~")
+    oauth = {
+        "oauth_consumer_key": consumer_key,
+        "oauth_nonce": secrets.token_hex(16),
+        "oauth_signature_method": "HMAC-SHA1",
+        "oauth_timestamp": str(int(time.time())),
+        "oauth_token": token,
+        "oauth_version": "1.0",
+    }
+    parameters = "&".join(f"{quote(k)}={quote(v)}" for k, v in sorted(oauth.items()))
+    base = "&".join((method.upper(), quote(url), quote(parameters)))
+    key = f"{quote(consumer_secret)}&{quote(token_secret)}"
+    digest = hmac.new(key.encode(), base.encode(), hashlib.sha1).digest()
+    oauth["oauth_signature"] = base64.b64encode(digest).decode()
+    return "OAuth " + ", ".join(f'{quote(k)}="{quote(v)}"' for k, v in sorted(oauth.items()))
+
+
+class Channel:
+    """Interface of a publishing channel."""
+
+    name = "channel"
+    rate = 1.0  # posts/s
+    idempotent = False  # whether a retried post cannot go out twice
+    max_length = 280  # weighted length of a post
+    url_length = 23  # weighted length of a link, None for its real length
+
+    def render(self, paper):
+        """Text of `paper` fitted to the channel: the reader's `tweet_text`
+        if the channel counts lengths like X, else rendered for it."""
+        import tweet_render
+
+        if paper.get("tweet_text") and (self.max_length, self.url_length) == (
+            tweet_render.max_length,
+            tweet_render.url_length,
+        ):
+            return paper["tweet_text"]
+        return tweet_render.render_tweet(paper, self.max_length, self.url_length)
+
+    async def send(self, session, text, key):
+        """Post `text` (`key` identifies the item, for idempotency) and
+        return (HTTP status, Retry-After header or None, JSON body or None)."""
+        raise NotImplementedError
+
+    def post_id(self, body):
+        """Identifier of the post in a successful response body."""
+        raise NotImplementedError
+
+
+async def _response(context):
+    async with context as response:
+        body = None
+        if response.content_type == "application/json":
+            body = await response.json()
+        return response.status, response.headers.get("Retry-After"), body
+
+
+class XChannel(Channel):
+    """An X account, through POST /2/tweets. Its credentials are read from
+    the environment: {env_prefix}API_KEY, {env_prefix}API_KEY_SECRET,
+    {env_prefix}ACCESS_TOKEN and {env_prefix}ACCESS_TOKEN_SECRET."""
+
+    def __init__(self, name="x", env_prefix="", rate=1.0, base_url="https://api.twitter.com/"):
+        self.name = name
+        self.env_prefix = env_prefix
+        self.rate = rate
+        self.base_url = base_url
+
+    async def send(self, session, text, key):
+        url = f"{self.base_url}2/tweets"
+        authorization = oauth1_header(
+            "POST",
+            url,
+            os.getenv(f"{self.env_prefix}API_KEY", ""),
+            os.getenv(f"{self.env_prefix}API_KEY_SECRET", ""),
+            os.getenv(f"{self.env_prefix}ACCESS_TOKEN", ""),
+            os.getenv(f"{self.env_prefix}ACCESS_TOKEN_SECRET", ""),
+        )
+        return await _response(
+            session.post(url, json={"text": text}, headers={"Authorization": authorization})
+        )
+
+    def post_id(self, body):
+        return body["data"]["id"]
+
+
+class MastodonChannel(Channel):
+    """A Mastodon account on `base_url`, through POST /api/v1/statuses with
+    the access token in the environment variable `token_env`. Retries
+    reuse an Idempotency-Key, so a post whose response was lost is not
+    published twice. Statuses are up to 500 characters, links counting as
+    23 like on X."""
+
+    max_length = 500
+    idempotent = True
+
+    def __init__(self, name="mastodon", base_url="https://mastodon.social/", token_env="MASTODON_TOKEN", rate=1.0):
+        self.name = name
+        self.base_url = base_url
+        self.token_env = token_env
+        self.rate = rate
+
+    async def send(self, session, text, key):
+        headers = {
+            "Authorization": f"Bearer {os.getenv(self.token_env, '')}",
+            "Idempotency-Key": f"{self.name}-{key}",
+        }
+        return await _response(
+            session.post(f"{self.base_url}api/v1/statuses", data={"status": text}, headers=headers)
+        )
+
+    def post_id(self, body):
+        return str(body["id"])
+
+
+class BlueskyChannel(Channel):
+    """A Bluesky account, through com.atproto.repo.createRecord, logged in
+    with the handle and app password in the environment variables
+    `handle_env` and `password_env` (the session is opened on first post).
+    Posts are up to 300 characters; links are posted as plain text, so
+    they count for their full length."""
+
+    max_length = 300
+    url_length = None
+
+    def __init__(
+        self,
+        name="bluesky",
+        base_url="https://bsky.social/",
+        handle_env="BLUESKY_HANDLE",
+        password_env="BLUESKY_APP_PASSWORD",
+        rate=1.0,
+    ):
+        self.name = name
+        self.base_url = base_url
+        self.handle_env = handle_env
+        self.password_env = password_env
+        self.rate = rate
+        self.session_tokens = None  # (did, access JWT)
+
+    async def send(self, session, text, key):
+        fresh_login = self.session_tokens is None
+        if fresh_login:
+            status, retry_after, body = await _response(
+                session.post(
+                    f"{self.base_url}xrpc/com.atproto.server.createSession",
+                    json={
+                        "identifier": os.getenv(self.handle_env, ""),
+                        "password": os.getenv(self.password_env, ""),
+                    },
+                )
+            )
+            if status != 200:
+                return status, retry_after, body
+            self.session_tokens = (body["did"], body["accessJwt"])
+        did, access_jwt = self.session_tokens
+        record = {
+            "$type": "app.bsky.feed.post",
+            "text": text,
+            "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        status, retry_after, body = await _response(
+            session.post(
+                f"{self.base_url}xrpc/com.atproto.repo.createRecord",
+                json={"repo": did, "collection": "app.bsky.feed.post", "record": record},
+                headers={"Authorization": f"Bearer {access_jwt}"},
+            )
+        )
+        if status == 401:
+            self.session_tokens = None
+            if not fresh_login:  # expired session: log in again
+                return await self.send(session, text, key)
+        return status, retry_after, body
+
+    def post_id(self, body):
+        return body["uri"]
+
+
+# 3. Publisher
+class Publisher:
+    """Posts to `channels` concurrently, each through its own token bucket
+    and retries. To be used as an async context manager, or opened and
+    closed explicitly to keep it (and its event loop) across calls.
+
+    >>> async with Publisher(channels) as publisher:
+    ...     results = await publisher.publish(text, key=pmid)
+    """
+
+    def __init__(self, channels, max_retries=3, backoff=1.0, timeout=30):
+        self.channels = {channel.name: channel for channel in channels}
+        self.buckets = {channel.name: TokenBucket(channel.rate) for channel in channels}
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.n_requests = 0  # HTTP requests sent, retries included
+        self.session = None
+
+    async def open(self):
+        """Open the HTTP session shared by the channels."""
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def close(self):
+        await self.session.close()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def deliver(self, name, text, key):
+        """Post `text` on channel `name` and return the post id. Raises
+        PublishError."""
+        channel = self.channels[name]
+        body = await retrying_send(
+            self,
+            f"post_{name}",
+            lambda: channel.send(self.session, text, key),
+            PublishError,
+            bucket=self.buckets[name],
+            ok_statuses=(200, 201),
+            statuses=retry_statuses if channel.idempotent else not_taken_statuses,
+            retry_errors=channel.idempotent,
+        )
+        return channel.post_id(body)
+
+    async def publish(self, text, names=None, key=None):
+        """Post `text` (a string, or {channel name: text}) on the channels
+        `names` (default: all) concurrently. Returns {channel name:
+        (post id, None) or (None, error message)}."""
+        names = list(self.channels) if names is None else list(names)
+        texts = text if isinstance(text, dict) else dict.fromkeys(names, text)
+
+        async def deliver(name):
+            try:
+                return await self.deliver(name, texts[name], key), None
+            except PublishError as e:
+                return None, str(e)
+            except Exception as e:  # e.g. an unexpected response body
+                logging.exception(f"{name} failed")
+                return None, repr(e)
+
+        outcomes = await asyncio.gather(*(deliver(name) for name in names))
+        return dict(zip(names, outcomes))
+
+    async def publish_papers(self, items):
+        """
+        Publish every (paper, channel names) of `items`, all concurrently,
+        and return their results (see `publish`) in the same order. Each
+        channel posts the paper's text rendered for it (`Channel.render`).
+        """
+        return await asyncio.gather(
+            *(
+                self.publish(
+                    {name: self.channels[name].render(paper) for name in names},
+                    names,
+                    paper["pmid"],
+                )
+                for paper, names in items
+            )
+        )
+
+
+async def publish_all(channels, items, **publisher_kwargs):
+    """Publish `items` (see `Publisher.publish_papers`) through a
+    publisher opened for this call only."""
+    async with Publisher(channels, **publisher_kwargs) as publisher:
+        return await publisher.publish_papers(items)
@@ -0,0 +1,570 @@
+"""PubMed
+
+Retrieval of recent PubMed articles through esearch/efetch, using the
+shared E-utilities client (eutils.py).
+
+Two modes are available: `fetch_recent_papers` downloads every record in a
+single efetch, while `iter_recent_papers` pages through the search history
+`page_size` records at a time and parses each page with iterparse, so peak
+memory only depends on the page size, not on the size of the date window.
+
+`harvest_recent_papers` adds incremental harvesting on top of a
+RecordStore (record_store.py): only records entered in PubMed since the
+last harvest of the same query are downloaded.
+
+Large windows can be searched by shard (`plan_shards`): one esearch per
+query (e.g. per journal) and date sub-range, run concurrently within the
+client's rate limit. A shard matching more records than esearch can return
+(`esearch_cap`) is split in two date halves until it fits, and the shards'
+results are merged without duplicate PMIDs.
+
+Structure:
+    1. Imports, Variables
+    2. Functions
+        2.1 Parsing
+        2.2 Single efetch
+        2.3 Streaming efetch
+        2.4 Incremental harvest
+        2.5 Sharded search
+"""
+# 1. Imports, Variables
+# imports
+import asyncio
+from datetime import datetime, timedelta
+import hashlib
+import io
+import logging
+import xml.etree.ElementTree as ET
+
+import eutils
+from eutils import EUtilsError
+
+# variables
+efetch_page_size = 500  # records per efetch request in streaming mode
+esearch_cap = 9999  # records retrievable per search (retstart limit)
+
+
+# 2. Functions
+# 2.1 Parsing
+def parse_article(article):
+    """
+    Extract the paper dict from a PubmedArticle element.
+    """
+    title = article.find(".//ArticleTitle").text
+    pmid = article.find(".//PMID").text
+    link = f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
+
+    # Extract keywords
+    keyword_list = article.find(".//KeywordList")
+
+    keywords = (
+        [keyword.text for keyword in keyword_list.findall(".//Keyword")]
+        if keyword_list is not None
+        else []
+    )
+
+    # Attempt to extract the DOI
+    article_doi = article.find(".//ArticleId[@IdType='doi']")
+    doi = article_doi.text if article_doi is not None else None
+
+    # Construct the link to the full article using DOI
+    doi_link = f"https://doi.org/{doi}" if doi else "Link not available"
+
+    # New code to fetch abstracts
+    abstract_text = article.find(".//Abstract/AbstractText")
+    abstract = abstract_text.text if abstract_text is not None else None
+
+    return {
+        "title": title,
+        "pmid": pmid,
+        "link": link,
+        "doi_link": doi_link,
+        "keywords": keywords,
+        "abstract": abstract,
+    }
+
+
+def iter_parse_articles(content):
+    """
+    Incrementally parse an efetch response, yielding one paper dict per
+    PubmedArticle. Finished articles are cleared and detached from the root
+    so the tree never holds more than the article being parsed.
+    """
+    root = None
+    for event, element in ET.iterparse(io.BytesIO(content), events=("start", "end")):
+        if root is None:
+            root = element
+        elif event == "end" and element.tag == "PubmedArticle":
+            yield parse_article(element)
+            element.clear()
+            root.remove(element)
+
+
+# 2.2 Single efetch
+def date_range_term(query, days_ago):
+    """
+    Restrict `query` to papers published in the last `days_ago` days.
+    """
+    end_date = datetime.today()
+    start_date = end_date - timedelta(days=days_ago)
+    start_date_str = start_date.strftime("%Y/%m/%d")
+    end_date_str = end_date.strftime("%Y/%m/%d")
+    return f'({query}) AND ("{start_date_str}"[Date - Publication] : "{end_date_str}"[Date - Publication])'
+
+
+async def search_history(client, term, n_articles):
+    """
+    Run esearch with usehistory=y and return (count, webenv, query_key).
+    """
+    count, webenv, query_key, _ = await search_history_ids(client, term, n_articles)
+    return count, webenv, query_key
+
+
+async def search_history_ids(client, term, n_articles):
+    """
+    Run esearch with usehistory=y and return (count, webenv, query_key,
+    the first `n_articles` PMIDs).
+    """
+    content = await client.esearch(
+        db="pubmed", term=term, retmax=n_articles, usehistory="y"
+    )
+    root = ET.fromstring(content)
+    webenv = root.find(".//WebEnv")
+    query_key = root.find(".//QueryKey")
+    if webenv is None or query_key is None:
+        error = root.find(".//ERROR")
+        raise EUtilsError(
+            f"esearch returned no history: {error.text if error is not None else 'unknown error'}"
+        )
+    count = root.find("Count")
+    pmids = [id_.text for id_ in root.findall("IdList/Id")]
+    return int(count.text) if count is not None else 0, webenv.text, query_key.text, pmids
+
+
+async def fetch_recent_papers_async(client, query, days_ago=90, n_articles=100000000):
+    """
+    Fetch recent papers from PubMed based on a query.
+    """
+    term = date_range_term(query, days_ago)
+    count, webenv, query_key = await search_history(client, term, n_articles)
+    if count == 0:
+        return []
+
+    # Fetch actual paper details using efetch
+    content = await client.efetch(
+        db="pubmed",
+        query_key=query_key,
+        WebEnv=webenv,
+        retmode="xml",
+        rettype="abstract",
+        retmax=n_articles,
+    )
+    fetch_root = ET.fromstring(content)
+    return [parse_article(article) for article in fetch_root.findall(".//PubmedArticle")]
+
+
+def fetch_recent_papers(query, days_ago=90, n_articles=100000000):
+    """
+    Fetch recent papers from PubMed based on a query.
+    Raises EUtilsError if PubMed cannot be reached.
+    """
+    return eutils.run(
+        fetch_recent_papers_async, query, days_ago=days_ago, n_articles=n_articles
+    )
+
+
+# 2.3 Streaming efetch
+async def iter_search_papers_async(client, term, page_size=efetch_page_size):
+    """
+    Run `term` through esearch and yield its papers, `page_size` records per
+    efetch request, as each page is parsed.
+    """
+    count, webenv, query_key = await search_history(client, term, 0)
+    async for paper in iter_history_papers_async(client, count, webenv, query_key, page_size):
+        yield paper
+
+
+async def iter_history_papers_async(client, count, webenv, query_key, page_size=efetch_page_size):
+    """
+    Yield the `count` papers of a search history, `page_size` records per
+    efetch request.
+    """
+    for retstart in range(0, count, page_size):
+        content = await client.efetch(
+            db="pubmed",
+            query_key=query_key,
+            WebEnv=webenv,
+            retmode="xml",
+            rettype="abstract",
+            retstart=retstart,
+            retmax=page_size,
+        )
+        for paper in iter_parse_articles(content):
+            yield paper
+        del content
+
+
+async def iter_recent_papers_async(
+    client, query, days_ago=90, page_size=efetch_page_size
+):
+    """
+    Fetch recent papers from PubMed based on a query, `page_size` records
+    per efetch request, yielding paper dicts as each page is parsed.
+    """
+    term = date_range_term(query, days_ago)
+    async for paper in iter_search_papers_async(client, term, page_size):
+        yield paper
+
+
+def iter_recent_papers(query, days_ago=90, page_size=efetch_page_size):
+    """
+    Generator over recent papers from PubMed based on a query.
+    Raises EUtilsError if PubMed cannot be reached.
+    """
+    return eutils.iterate(
+        iter_recent_papers_async, query, days_ago=days_ago, page_size=page_size
+    )
+
+
+# 2.4 Incremental harvest
+async def search_ids_async(client, term, page_size=10000):
+    """
+    Return the PMIDs matching `term` (ids only, no records). Raises
+    EUtilsError if more records match than esearch can list (see
+    `resolve_shards`).
+    """
+    pmids = []
+    count = None
+    while count is None or len(pmids) < count:
+        content = await client.esearch(
+            db="pubmed",
+            term=term,
+            retstart=len(pmids),
+            retmax=min(page_size, esearch_cap - len(pmids)),
+        )
+        root = ET.fromstring(content)
+        count = root.find("Count")
+        if count is None:
+            error = root.find(".//ERROR")
+            raise EUtilsError(
+                f"esearch failed: {error.text if error is not None else 'unknown error'}"
+            )
+        count = int(count.text)
+        if count > esearch_cap:
+            # esearch cannot list past its cap: search by shard instead
+            raise EUtilsError(f"{count} records match, esearch lists at most {esearch_cap}: {term}")
+        page = [id_.text for id_ in root.findall("IdList/Id")]
+        if not page:
+            break
+        pmids += page
+    return pmids
+
+
+async def iter_papers_by_ids_async(client, pmids, page_size=efetch_page_size):
+    """
+    Fetch the records of `pmids`, `page_size` per POSTed efetch request.
+    """
+    for start in range(0, len(pmids), page_size):
+        content = await client.request(
+            "efetch",
+            {
+                "db": "pubmed",
+                "id": ",".join(str(pmid) for pmid in pmids[start : start + page_size]),
+                "retmode": "xml",
+                "rettype": "abstract",
+            },
+            method="POST",
+        )
+        for paper in iter_parse_articles(content):
+            yield paper
+
+
+def watermark_name(query):
+    """Watermark key of a query: a new query starts a fresh harvest."""
+    return "pubmed:" + hashlib.sha1(query.encode()).hexdigest()[:16]
+
+
+async def iter_harvest_papers_async(
+    client,
+    store,
+    query,
+    days_ago=90,
+    page_size=efetch_page_size,
+    shard_queries=None,
+    shard_days=None,
+):
+    """
+    Incrementally fetch recent papers from PubMed based on a query,
+    yielding each page of records as soon as it is in `store`.
+
+    1. Download the records of the publication window entered in PubMed
+       since the query's watermark (everything on the first run) into
+       `store`.
+    2. List the PMIDs currently in the window (a cheap ids-only esearch) and
+       download any record still missing from `store`, e.g. papers whose
+       publication date was corrected into the window.
+    3. Move the watermark to today and yield the window's papers that were
+       not downloaded, from `store`.
+
+    The watermark is inclusive (Entrez dates have day granularity), so
+    records entered on the day of the previous run are fetched again and
+    simply overwritten. It only moves once every download is done, so a
+    harvest stopped early is repeated by the next one.
+
+    The window is searched by shard (see `plan_shards`), split by date
+    until each fits under esearch's cap: one esearch per shard lists its
+    PMIDs and keeps a history to efetch them. The shards are the
+    `shard_queries` (queries whose OR is `query`, e.g. one per journal) if
+    given, else `query` itself.
+    """
+    name = watermark_name(query)
+    watermark = store.get_watermark(name)
+    harvest_date = datetime.today().strftime("%Y/%m/%d")
+
+    shards = plan_shards(shard_queries or [query], days_ago, shard_days)
+    resolved = await resolve_shards(client, shards)
+    pmids = resolved_ids(resolved)
+    if watermark is None:
+        delta = iter_resolved_papers_async(client, resolved, page_size)
+    else:
+        # the delta is a sub-range of a resolved shard, so it fits under
+        # the cap without being resolved again
+        delta_clause = f'("{watermark}"[Date - Entry] : "3000"[Date - Entry])'
+        delta_ids = await asyncio.gather(
+            *(search_ids_async(client, shard.term(delta_clause)) for shard, *_ in resolved)
+        )
+        delta_ids = list(dict.fromkeys(pmid for ids in delta_ids for pmid in ids))
+        delta = iter_papers_by_ids_async(client, delta_ids, page_size)
+    yielded = set()
+    async for paper in _stored_pages(store, delta, page_size):
+        yielded.add(paper["pmid"])
+        yield paper
+    n_delta = len(yielded)
+    missing = store.missing_pmids(pmids)
+    if missing:
+        missing_papers = iter_papers_by_ids_async(client, missing, page_size)
+        async for paper in _stored_pages(store, missing_papers, page_size):
+            yielded.add(paper["pmid"])
+            yield paper
+    store.set_watermark(name, harvest_date)
+    logging.info(
+        f"Harvested {n_delta} new and {len(missing)} missing records "
+        f"(watermark {watermark} -> {harvest_date}), {len(pmids)} in window"
+    )
+    for paper in store.get_papers([pmid for pmid in pmids if pmid not in yielded]):
+        yield paper
+
+
+async def _stored_pages(store, papers, page_size):
+    """Upsert the async iterable `papers` into `store` `page_size` records
+    at a time, yielding each page once it is stored."""
+    page = []
+    async for paper in papers:
+        page.append(paper)
+        if len(page) >= page_size:
+            store.upsert_papers(page)
+            for stored in page:
+                yield stored
+            page = []
+    if page:
+        store.upsert_papers(page)
+        for stored in page:
+            yield stored
+
+
+async def harvest_recent_papers_async(
+    client,
+    store,
+    query,
+    days_ago=90,
+    page_size=efetch_page_size,
+    shard_queries=None,
+    shard_days=None,
+):
+    """
+    Incrementally fetch recent papers from PubMed based on a query and
+    return the window's papers (see `iter_harvest_papers_async`).
+    """
+    return [
+        paper
+        async for paper in iter_harvest_papers_async(
+            client, store, query, days_ago, page_size, shard_queries, shard_days
+        )
+    ]
+
+
+def harvest_recent_papers(
+    store, query, days_ago=90, page_size=efetch_page_size, shard_queries=None, shard_days=None
+):
+    """
+    Incrementally fetch recent papers from PubMed based on a query.
+    Raises EUtilsError if PubMed cannot be reached.
+    """
+    return eutils.run(
+        harvest_recent_papers_async,
+        store,
+        query,
+        days_ago=days_ago,
+        page_size=page_size,
+        shard_queries=shard_queries,
+        shard_days=shard_days,
+    )
+
+
+# 2.5 Sharded search
+class Shard:
+    """One query over an inclusive publication date range (datetime.date)."""
+
+    def __init__(self, query, start, end):
+        self.query = query
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f"Shard({self.query!r}, {self.start}, {self.end})"
+
+    def term(self, extra=None):
+        term = (
+            f'({self.query}) AND ("{self.start:%Y/%m/%d}"[Date - Publication] : '
+            f'"{self.end:%Y/%m/%d}"[Date - Publication])'
+        )
+        return f"{term} AND {extra}" if extra else term
+
+    def split(self):
+        """The two halves of the date range, or None for a single day."""
+        if self.start >= self.end:
+            return None
+        middle = self.start + (self.end - self.start) // 2
+        return (
+            Shard(self.query, self.start, middle),
+            Shard(self.query, middle + timedelta(days=1), self.end),
+        )
+
+
+def plan_shards(queries, days_ago=90, shard_days=None):
+    """
+    Shards covering the last `days_ago` days for every query of `queries`
+    (e.g. one per journal), each date range cut in sub-ranges of
+    `shard_days` days (a single range if None).
+    """
+    end = datetime.today().date()
+    start = end - timedelta(days=days_ago)
+    step = timedelta(days=shard_days or days_ago + 1)
+    shards = []
+    for query in queries:
+        shard_start = start
+        while shard_start <= end:
+            shard_end = min(shard_start + step - timedelta(days=1), end)
+            shards.append(Shard(query, shard_start, shard_end))
+            shard_start = shard_end + timedelta(days=1)
+    return shards
+
+
+async def resolve_shards(client, shards, extra=None, cap=esearch_cap):
+    """
+    Run the esearch of every shard concurrently, splitting the date range
+    of any shard matching more than `cap` records until each fits. Returns
+    (shard, count, webenv, query_key, pmids) for the non-empty shards: the
+    same esearch lists the shard's PMIDs and keeps its history for efetch,
+    so a resolved shard needs no other search.
+    """
+    resolved = []
+    while shards:
+        histories = await asyncio.gather(
+            *(search_history_ids(client, shard.term(extra), cap) for shard in shards)
+        )
+        too_large = []
+        for shard, (count, webenv, query_key, pmids) in zip(shards, histories):
+            if count > cap:
+                halves = shard.split()
+                if halves:
+                    too_large += halves
+                    continue
+                logging.warning(f"{shard} matches {count} records, only {cap} can be fetched")
+            if count:
+                resolved.append((shard, min(count, cap), webenv, query_key, pmids))
+        shards = too_large
+    return resolved
+
+
+async def iter_sharded_papers_async(
+    client, shards, page_size=efetch_page_size, extra=None, max_concurrent=4
+):
+    """
+    Fetch the papers of `shards`, up to `max_concurrent` shards at a time
+    (all requests still share the client's rate limit), yielding the
+    papers of each efetch page as it is parsed, without duplicate PMIDs.
+    """
+    resolved = await resolve_shards(client, shards, extra)
+    async for paper in iter_resolved_papers_async(client, resolved, page_size, max_concurrent):
+        yield paper
+
+
+async def iter_resolved_papers_async(
+    client, resolved, page_size=efetch_page_size, max_concurrent=4
+):
+    """Fetch the papers of shards already resolved (see `resolve_shards`)
+    through their search histories, like `iter_sharded_papers_async`."""
+    semaphore = asyncio.Semaphore(max_concurrent)
+    queue = asyncio.Queue(maxsize=page_size * max_concurrent)
+
+    async def fetch_shard(count, webenv, query_key):
+        # no end marker once cancelled (see sources.merge_papers_async)
+        try:
+            async with semaphore:
+                async for paper in iter_history_papers_async(
+                    client, count, webenv, query_key, page_size
+                ):
+                    await queue.put(paper)
+        except Exception as error:
+            await queue.put(error)
+            return
+        await queue.put(None)
+
+    tasks = [
+        asyncio.create_task(fetch_shard(count, webenv, query_key))
+        for _, count, webenv, query_key, _ in resolved
+    ]
+    seen = set()
+    try:
+        n_running = len(tasks)
+        while n_running:
+            paper = await queue.get()
+            if paper is None:  # a shard is done
+                n_running -= 1
+                continue
+            if isinstance(paper, Exception):
+                raise paper
+            if paper["pmid"] not in seen:
+                seen.add(paper["pmid"])
+                yield paper
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    logging.info(f"Fetched {len(seen)} papers from {len(resolved)} shards")
+
+
+def iter_sharded_recent_papers(queries, days_ago=90, page_size=efetch_page_size, shard_days=None):
+    """
+    Generator over recent papers of `queries`, fetched by shard.
+    Raises EUtilsError if PubMed cannot be reached.
+    """
+    return eutils.iterate(
+        iter_sharded_papers_async,
+        plan_shards(queries, days_ago, shard_days),
+        page_size=page_size,
+    )
+
+
+async def search_sharded_ids_async(client, shards, extra=None):
+    """Return the PMIDs matching `shards` (ids only, no records)."""
+    return resolved_ids(await resolve_shards(client, shards, extra))
+
+
+def resolved_ids(resolved):
+    """PMIDs of resolved shards, without duplicates."""
+    pmids = {}
+    for *_, shard_pmids in resolved:
+        pmids.update(dict.fromkeys(shard_pmids))
+    return list(pmids)
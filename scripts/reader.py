@@ -4,36 +4,100 @@ This scritp aims to retrieve relevent articles, check it hasn't published them y
 and summarizes and stores them in a dataframe. This dataframe will be used by the
 writer to publish tweets.
 
+Papers come from the configured `paper_sources` (PubMed, bioRxiv, medRxiv,
+see sources.py), fetched concurrently and merged into one pipeline.
+
+The work is split in named stages that can run on their own or chained:
+    fetch       retrieve recent papers from every source
+    dedup       drop papers that are the same work as a queued paper or as
+                another paper of the run (preprint + journal version,
+                errata, republications), see dedup_index.py
+    cite        fetch citation counts (PubMed papers only)
+    filter      drop papers with too few known citations or already tweeted
+    rank        keep the top_k papers by relevance to `topic_profile` and
+                citations (TF-IDF, see relevance.py)
+    summarize   summarize abstracts, with BART or extractively (the only
+                stage importing torch, transformers and spaCy)
+    render      render the final tweet text of every paper
+    export      append the papers to the paper store, enqueue them for the
+                writer and add them to the dedup index
+Each stage saves its output in results/reader_state/, so a later run can
+resume from there. Heavy libraries are imported by the stages that need
+them, so e.g. a fetch-only run starts without the ML import cost.
+
+Every stage is instrumented (wall/CPU time, peak RSS, disk blocks, HTTP
+requests and latencies, cache hit rates, items in/out, see
+instrumentation.py): each run writes a JSON report in results/reports/, and
+optionally a Prometheus text file.
+
+With --pipelined, the stages run concurrently on batches of
+`pipeline_batch_size` papers linked by bounded queues (see pipeline.py):
+the first papers are cited, summarized and exported while later pages are
+still downloading, and PubMed requests of all stages share one rate
+limiter. Ranking then applies per batch: `min_relevance` is kept, but not
+the run-wide `top_k`, and relevance IDFs are those of the batch.
+
+With --daemon, the reader stays up and runs all stages every
+`daemon_interval` seconds, or as soon as it receives SIGUSR1. The
+summarizer and the sentence segmenter are loaded once, at start-up, and
+each run only processes the delta: papers already in the tweet queue,
+whatever their status, are dropped by the filter stage, so only new papers
+are summarized and exported. Papers are not kept between runs, so memory
+stays bounded across days (each run's report has a `cleanup` stage with the
+resident memory after it). SIGTERM or Ctrl-C stop the daemon after the
+current run.
+
+Usage:
+    python reader.py                    # all stages
+    python reader.py fetch cite         # refresh papers and citations only
+    python reader.py summarize export --workers 4
+    python reader.py summarize --profile --prometheus ../results/reader.prom
+    python reader.py summarize render --summarizer hybrid
+    python reader.py --pipelined --summarizer hybrid
+    python reader.py --daemon --interval 3600 &   # then: kill -USR1 <pid> to run now
+
 Structure:
-    1. Retrieve Articles
-        1.1 Imports, Variables, Functions
-        1.2 Fetching Recent Papers
-        1.3 Fetching Citation CountS
-        1.4 Filter Papers
-        1.5 Store in DataFrame
-    2. Summarize Articles
-        2.1 Imports, Variables, Functions
-        2.2 Load Model
-        2.3 Summarize Articles
-        2.4 Save DataFrame
+    1. Imports, Variables
+    2. Functions
+        2.1 Stage State
+        2.2 Stages
+    3. Main
 """
-# 1. Retrieve Articles
-# 1.1 Imports, Variables, Functions
+# 1. Imports, Variables
 # imports
-import requests
-from datetime import datetime, timedelta
-import xml.etree.ElementTree as ET
-import logging, pandas as pd, json, os, sys
+import argparse
+import logging, json, os, sys
+import asyncio, copy, gc, signal, threading
 
-logging.basicConfig(level=logging.INFO)
+from dotenv import load_dotenv
 
-from tqdm.contrib.concurrent import (
-    process_map,
-)  # Import process_map for multiprocessing
+import instrumentation
+from citation_cache import RefreshPolicy
+from sources import PubMedSource, RxivSource
 
 # variables
+stages = ("fetch", "dedup", "cite", "filter", "rank", "summarize", "render", "export")
+state_dir = os.path.join("..", "results", "reader_state")
+report_dir = os.path.join("..", "results", "reports")  # JSON run reports
+prometheus_path = None  # e.g. a node exporter textfile, None to disable
+profile_path = os.path.join(report_dir, "summarize.prof")  # with --profile
+
+# retrieve articles
 min_citations = 1
 days_ago = 460
+efetch_page_size = 500  # records per efetch page, None for a single efetch
+incremental = True  # only download records added since the previous run
+shard_by_journal = True  # one concurrent search per journal (and date range)
+shard_days = None  # days per date shard, None for the whole window (shards
+# over esearch's 9999-record cap are split in halves automatically)
+record_store_path = os.path.join("..", "results", "pubmed.sqlite")
+citation_batch_size = 200  # PMIDs per ELink request, None for one request per PMID
+citation_cache_path = os.path.join("..", "results", "pubmed.sqlite")  # None to disable
+citation_refresh_policy = RefreshPolicy(
+    tiers=[(30, 1), (180, 7), (365, 14)],  # (max age, refresh every) in days
+    stable_after_days=90,  # counts unchanged this long are...
+    stable_refresh_days=30,  # ...only refreshed this often
+)
 journals = [
     "Bioinformatics",
     "BMC Bioinformatics",
@@ -89,211 +153,545 @@ journal_queries = ['"' + journal + '"[Journal]' for journal in journals]
 # query = 'chemoinformatics OR "AI biomedicine"'
 query = " OR ".join(journal_queries)
 
+# sources, fetched concurrently; preprints have no citation count and are
+# only filtered on whether they were already tweeted
+paper_sources = [
+    PubMedSource(
+        query,
+        days_ago=days_ago,
+        page_size=efetch_page_size,
+        record_store_path=record_store_path if incremental else None,
+        shard_queries=journal_queries if shard_by_journal else None,
+        shard_days=shard_days,
+    ),
+    # RxivSource("biorxiv", days_ago=30, categories=["bioinformatics"]),
+    # RxivSource("medrxiv", days_ago=30, categories=["health informatics"]),
+]
 
-# functions
-def fetch_citation_count(pmid):
-    """
-    Fetch citation count for a given PMID.
-    """
-    elink_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/elink.fcgi"
-    params = {
-        "dbfrom": "pubmed",
-        "db": "pubmed",
-        "id": pmid,
-        "linkname": "pubmed_pubmed_citedin",  # Link to citing articles
-        "retmode": "xml",
-    }
 
-    response = requests.get(elink_url, params=params)
-    if response.status_code == 200:
-        root = ET.fromstring(response.content)
-        citation_count = len(root.findall(".//LinkSetDb/Link"))
-        return citation_count
-    return 0  # Return 0 if unable to fetch citation count
-
-
-def fetch_citations_for_papers(papers):
-    """
-    Fetch citation counts for a list of papers in parallel.
-    """
-    pmids = [paper["pmid"] for paper in papers]
-    citation_counts = process_map(fetch_citation_count, pmids, max_workers=10)
-    for paper, citation_count in zip(papers, citation_counts):
-        paper["citations"] = citation_count
-    return papers
+# rank articles: TF-IDF relevance of title, abstract and keywords to the
+# topic profile, mixed with citations
+topic_profile = [
+    "bioinformatics",
+    "computational biology",
+    "genomics",
+    "genome sequencing",
+    "proteomics",
+    "protein structure prediction",
+    "single-cell RNA-seq",
+    "gene expression",
+    "cheminformatics",
+    "drug discovery",
+    "biomedical machine learning",
+    "deep learning",
+    "biological networks",
+]
+top_k = 100  # papers per run sent to summarization, None to keep all
+citation_weight = 0.3  # weight of citations against relevance (0-1 each)
+min_relevance = 0.0  # drop papers less relevant than this
 
+# summarize articles
+prompt = "Summarize the following abstract from a scientific article: %s"
+model_path = os.path.join("..", "data", "llama-2-7b-chat.Q4_K_M.gguf")
+output_path = os.path.join("..", "results", "papers_to_tweet.csv")
+paper_store_path = os.path.join("..", "results", "papers")  # Parquet paper store
+tweet_queue_path = os.path.join("..", "results", "tweet_queue.sqlite")
+export_csv = False  # also write the legacy output_path CSV
+summarizer_mode = "abstractive"  # "abstractive" (BART), "extractive" or "hybrid"
+# (extractive when confident, BART otherwise), see extractive.py
+summarizer_model = "../bart-large-cnn"
+summarizer_backend = "torch"  # "torch" (fp32), "int8" (quantized) or "onnx" (ONNX Runtime)
+generation_params = {"max_length": 40, "min_length": 10, "do_sample": False}
+summary_cache_path = os.path.join("..", "results", "pubmed.sqlite")
+summary_batch_size = 8  # abstracts per forward pass, batched by similar length
+dedup_index_path = os.path.join("..", "results", "pubmed.sqlite")  # None to disable
+pipeline_batch_size = 50  # papers per batch of --pipelined
+pipeline_max_queued = 2  # batches waiting between two stages of --pipelined
+daemon_interval = 24 * 3600  # seconds between the runs of --daemon
+
+
+# 2. Functions
+# 2.1 Stage State
+def save_state(stage, papers):
+    """Save the papers produced by `stage`."""
+    os.makedirs(state_dir, exist_ok=True)
+    with open(os.path.join(state_dir, f"{stage}.json"), "w") as f:
+        json.dump(papers, f)
+
+
+def load_state(stage):
+    """Load the papers produced by an earlier run of `stage`."""
+    path = os.path.join(state_dir, f"{stage}.json")
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        sys.exit(f"No output of the {stage} stage in {path}, run it first.")
 
-def fetch_recent_papers(query, days_ago=90, n_articles=100000000):
-    """
-    Fetch recent papers from PubMed based on a query and include citation counts.
-    """
-    # Calculate date range
-    end_date = datetime.today()
-    start_date = end_date - timedelta(days=days_ago)
-    start_date_str = start_date.strftime("%Y/%m/%d")
-    end_date_str = end_date.strftime("%Y/%m/%d")
-
-    # PubMed API endpoint
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-    params = {
-        "db": "pubmed",
-        "term": f'({query}) AND ("{start_date_str}"[Date - Publication] : "{end_date_str}"[Date - Publication])',
-        "retmax": n_articles,
-        "usehistory": "y",
-    }
 
-    response = requests.get(base_url, params=params)
-    if response.status_code == 200:
-        root = ET.fromstring(response.content)
-        webenv = root.find(".//WebEnv").text
-        query_key = root.find(".//QueryKey").text
-
-        # Fetch actual paper details using efetch
-        fetch_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
-        fetch_params = {
-            "db": "pubmed",
-            "query_key": query_key,
-            "WebEnv": webenv,
-            "retmode": "xml",
-            "rettype": "abstract",
-            "retmax": n_articles,
-        }
-        fetch_response = requests.get(fetch_url, params=fetch_params)
-        if fetch_response.status_code == 200:
-            fetch_root = ET.fromstring(fetch_response.content)
-            papers = []
-            for article in fetch_root.findall(".//PubmedArticle"):
-                title = article.find(".//ArticleTitle").text
-                pmid = article.find(".//PMID").text
-                link = f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
-
-                # Extract keywords
-                keyword_list = article.find(".//KeywordList")
-
-                keywords = (
-                    [keyword.text for keyword in keyword_list.findall(".//Keyword")]
-                    if keyword_list is not None
-                    else []
-                )
+# 2.2 Stages
+def fetch():
+    """Fetch recent papers from every source."""
+    from sources import fetch_papers
 
-                # Attempt to extract the DOI
-                article_doi = article.find(".//ArticleId[@IdType='doi']")
-                doi = article_doi.text if article_doi is not None else None
+    papers = fetch_papers(paper_sources)
+    logging.info(f"Nº of papers: {len(papers)}")
+    return papers
 
-                # Construct the link to the full article using DOI
-                doi_link = (
-                    f"https://doi.org/{doi}" if doi else "Link not available"
-                )
 
-                # New code to fetch abstracts
-                abstract_text = article.find(".//Abstract/AbstractText")
-                abstract = (
-                    abstract_text.text
-                    if abstract_text is not None
-                    else None
-                )
+def dedup(papers, batch=None):
+    """Drop exact and near duplicates of queued papers and of each other
+    (and of the papers of `batch`, an in-memory DedupIndex)."""
+    if not dedup_index_path:
+        return papers
+    from dedup_index import DedupIndex
 
-                papers.append(
-                    {
-                        "title": title,
-                        "pmid": pmid,
-                        "link": link,
-                        "doi_link": doi_link,
-                        "keywords": keywords,
-                        "abstract": abstract,
-                    }
-                )
-            return papers
-    return "Failed to fetch papers or no papers found."
+    with DedupIndex(dedup_index_path) as index:
+        papers, duplicates = index.deduplicate(papers, batch=batch)
+    for paper, duplicate_of in duplicates:
+        logging.info(f"Duplicate: {paper['pmid']} ({paper['title']}) of {duplicate_of}")
+    instrumentation.record("duplicates", len(duplicates))
+    return papers
 
 
-def load_tweeted_pmids():
-    try:
-        with open(os.path.join("..","results","tweeted.json"), 'r') as f:
-            return set(json.load(f))  # Load and convert list back to set
-    except FileNotFoundError:
-        return set()  # Return an empty set if the file doesn't exist
+def cite(papers):
+    """Fetch citation counts."""
+    import eutils
 
-tweeted_pmids = load_tweeted_pmids()
+    return eutils.run(cite_async, papers)
 
-# 1.2 Fetching Recent Papers
-papers = fetch_recent_papers(query, days_ago=days_ago)
-logging.info(f"Nº of papers: {len(papers)}")
 
-# 1.3 Fetching Citation Counts
-papers = fetch_citations_for_papers(papers)
-logging.info(
-    f"Nº of papers w/ citations in less than {days_ago} days : {len([p for p in papers if p['citations'] > 0])}"
-)
+async def cite_async(client, papers):
+    """Fetch citation counts through `client`."""
+    from citations import fetch_citations_for_papers_async
+    from citation_cache import CitationCache
 
-# 1.4 Filter Papers
+    # citation counts come from PubMed's ELink: other papers keep None
+    pubmed_papers = [p for p in papers if p.get("source", "pubmed") == "pubmed"]
+    for paper in papers:
+        paper.setdefault("citations", None)
+    if citation_cache_path:
+        with CitationCache(citation_cache_path, citation_refresh_policy) as citation_cache:
+            await fetch_citations_for_papers_async(
+                client, pubmed_papers, batch_size=citation_batch_size, cache=citation_cache
+            )
+            instrumentation.record_hit_rate(
+                "citation_cache", citation_cache.hits, citation_cache.hits + citation_cache.misses
+            )
+    else:
+        await fetch_citations_for_papers_async(
+            client, pubmed_papers, batch_size=citation_batch_size
+        )
+    logging.info(
+        f"Nº of papers w/ citations in less than {days_ago} days : {len([p for p in papers if (p['citations'] or 0) > 0])}"
+    )
+    return papers
 
-# filter papers with less than min_citations
-papers = [p for p in papers if p["citations"] >= min_citations]
 
-# filter papers which have already been tweeted by writer
-tweeted_pmids = load_tweeted_pmids()
-papers = [p for p in papers if p["pmid"] not in tweeted_pmids]
+def filter_papers(papers, delta=False):
+    """Filter papers with too few citations or already tweeted (with
+    `delta`, already queued)."""
+    # filter papers with less than min_citations (unknown for preprints)
+    papers = [
+        p for p in papers if p["citations"] is None or p["citations"] >= min_citations
+    ]
 
-# 1.5 Store in DataFrame
-df_papers = pd.DataFrame(papers)
+    # filter papers which have already been tweeted by writer
+    from tweet_queue import TweetQueue
 
+    with TweetQueue(tweet_queue_path) as queue:
+        pmids = (p["pmid"] for p in papers)
+        known_pmids = queue.queued_pmids(pmids) if delta else queue.posted_pmids(pmids)
+    papers = [p for p in papers if int(p["pmid"]) not in known_pmids]
+    return papers
 
-# 2 Summarize Articles
-# 2.1 Imports, Variables, Functions
-# imports
-from transformers import pipeline
-import os, sys
-from tqdm import tqdm
-import spacy
-# Load the spaCy model, assuming English language for this example
-nlp = spacy.load("en_core_web_sm")
 
-# variables
-prompt = "Summarize the following abstract from a scientific article: %s"
-model_path = os.path.join("..", "data", "llama-2-7b-chat.Q4_K_M.gguf")
-output_path = os.path.join("..", "results", "papers_to_tweet.csv")
+def rank(papers, per_batch=False):
+    """Keep the top_k papers by relevance to the topic profile and citations
+    (`per_batch`: only drop papers under min_relevance)."""
+    from relevance import rank_papers
+
+    return rank_papers(
+        papers,
+        topic_profile,
+        top_k=None if per_batch else top_k,
+        citation_weight=citation_weight,
+        min_relevance=min_relevance,
+    )
+
+
+def summarize(papers, workers=1, threads_per_worker=None, profile=False, mode=None):
+    """Add an `abstract_summary` to every paper, with `mode` (by default
+    `summarizer_mode`)."""
+    mode = mode or summarizer_mode
+    summaries = [None] * len(papers)
+    methods = [None] * len(papers)
+    abstractive = [i for i, paper in enumerate(papers) if paper["abstract"] is not None]
+    if mode in ("extractive", "hybrid") and papers:
+        import pandas as pd
+        from extractive import extract_summaries
+        from tweet_render import summary_budgets
+
+        extracted, confident = extract_summaries(
+            [paper["abstract"] for paper in papers], summary_budgets(pd.DataFrame(papers))
+        )
+        # extractive mode keeps every pick, hybrid only the confident ones
+        keep = [i for i in abstractive if mode == "extractive" or confident[i]]
+        for i in keep:
+            summaries[i], methods[i] = extracted[i], "extractive"
+        abstractive = [i for i in abstractive if methods[i] is None]
+        logging.info(f"Extractive summaries: {len(keep)}, sent to BART: {len(abstractive)}")
+        instrumentation.record("extractive_summaries", len(keep))
+
+    if abstractive:
+        abstractive_summaries = summarize_abstractive(
+            [papers[i] for i in abstractive], workers, threads_per_worker, profile
+        )
+        for i, summary in zip(abstractive, abstractive_summaries):
+            summaries[i], methods[i] = summary, "abstractive"
+
+    for paper, abstract_summary, method in zip(papers, summaries, methods):
+        print(abstract_summary)
+        paper["abstract_summary"] = abstract_summary
+        paper["summary_method"] = method
+    return papers
 
-# functions
-
-
-# 2.2 Load the Model
-summarizer = pipeline("summarization", model="../bart-large-cnn")
-
-# 2.3 Summarize Articles
-abstract_summaries = list()
-for index, row in tqdm(df_papers.iterrows()):
-    if row["abstract"] is not None:
-        abstract_summary = summarizer(
-            prompt % row["abstract"], max_length=40, min_length=10, do_sample=False
-        )[0]["summary_text"]
-
-        # Use spaCy for sentence detection
-        doc = nlp(abstract_summary)
-        sentences = list(doc.sents)
-        
-        # Process based on the number of sentences
-        if len(sentences) > 1:
-            # Join all sentences except the last incomplete one
-            abstract_summary = ' '.join(sentence.text for sentence in sentences[:-1])
-        elif len(sentences) == 1:
-            # Ensure the single sentence ends with a period
-            abstract_summary = sentences[0].text 
-        else:
-            # No sentences detected, unlikely but handled
-            abstract_summary = None
-            logging.info("No sentences detected in the summary.")
+
+def summarize_abstractive(papers, workers=1, threads_per_worker=None, profile=False):
+    """BART summaries of the papers' abstracts, as a list."""
+    from tqdm import tqdm
+    from summary_cache import SummaryCache, summary_key
+    from summarize import (
+        shared_summarizer,
+        iter_summary_batches,
+        iter_sharded_summary_batches,
+        summarizer_id,
+    )
+    from sentences import trim_summaries
+
+    # Summaries are cached by abstract, prompt, model and generation parameters,
+    # so the model is only loaded if some abstract has not been summarized yet.
+    summary_cache = SummaryCache(summary_cache_path)
+    abstracts = [paper["abstract"] for paper in papers]
+    summary_keys = [
+        summary_key(
+            abstract,
+            prompt,
+            summarizer_id(summarizer_model, summarizer_backend),
+            **generation_params,
+        )
+        if abstract is not None
+        else None
+        for abstract in abstracts
+    ]
+    cached_summaries = summary_cache.get_many(key for key in summary_keys if key)
+    new_abstracts = {
+        key: abstract
+        for key, abstract in zip(summary_keys, abstracts)
+        if key and key not in cached_summaries
+    }
+    logging.info(
+        f"Summary cache: {len(cached_summaries)} cached, {len(new_abstracts)} new abstracts to summarize"
+    )
+    instrumentation.record_hit_rate(
+        "summary_cache", len(cached_summaries), len(cached_summaries) + len(new_abstracts)
+    )
+
+    # new abstracts, in length-bucketed batches, checkpointed after each batch
+    new_keys = list(new_abstracts)
+    new_texts = [prompt % abstract for abstract in new_abstracts.values()]
+    if not new_texts:
+        summary_batches = []
+    elif workers > 1:
+        # each worker process loads its own copy of the model
+        summary_batches = iter_sharded_summary_batches(
+            summarizer_model,
+            new_texts,
+            workers,
+            threads_per_worker=threads_per_worker,
+            backend=summarizer_backend,
+            batch_size=summary_batch_size,
+            **generation_params,
+        )
     else:
-        abstract_summary = None
+        summarizer = shared_summarizer(summarizer_model, backend=summarizer_backend)
+        summary_batches = iter_summary_batches(
+            summarizer, new_texts, batch_size=summary_batch_size, **generation_params
+        )
+    with instrumentation.profiled(profile, profile_path), tqdm(total=len(new_keys)) as progress:
+        for batch in summary_batches:
+            batch_summaries = {new_keys[i]: summary for i, summary in batch}
+            summary_cache.put_many(batch_summaries)
+            cached_summaries.update(batch_summaries)
+            progress.update(len(batch))
+    summary_cache.close()
+
+    # drop the trailing partial sentence of every summary, in one batched pass
+    return trim_summaries(cached_summaries[key] if key else None for key in summary_keys)
+
+
+def render(papers):
+    """Add the final `tweet_text` to every paper, for the whole table at once."""
+    import pandas as pd
+    from tweet_render import render_tweets
+
+    if papers:
+        tweets = render_tweets(pd.DataFrame(papers))
+        for paper, tweet_text in zip(papers, tweets):
+            paper["tweet_text"] = tweet_text
+    return papers
+
+
+def export(papers):
+    """Append the papers to the paper store and enqueue them for the writer."""
+    from paper_store import PaperStore
+    from tweet_queue import TweetQueue
 
-    print(abstract_summary)
-    abstract_summaries.append(abstract_summary)
+    partition = PaperStore(paper_store_path).append(papers)
+    logging.info(f"{len(papers)} papers saved in {partition}")
+    with TweetQueue(tweet_queue_path) as queue:
+        n_enqueued = queue.enqueue(papers)
+    logging.info(f"{n_enqueued} new papers queued for the writer")
+    if dedup_index_path:
+        from dedup_index import DedupIndex
 
-df_papers["abstract_summary"] = abstract_summaries
+        with DedupIndex(dedup_index_path) as index:
+            index.add(papers)
 
+    if export_csv:
+        import pandas as pd
 
+        df_papers = pd.DataFrame(papers)
+        df_papers.to_csv(output_path, index=False)
+        logging.info(f"DataFrame saved in {output_path}")
+    return papers
+
+
+# 3. Main
+def run_stages(selected, args, run, delta=False):
+    """Run the `selected` stages in pipeline order, each measured in `run`,
+    and return the papers of the last one."""
+    papers = None
+    for stage in selected:
+        if papers is None and stage != "fetch":
+            # resume from the output of the previous stage
+            papers = load_state(stages[stages.index(stage) - 1])
+
+        with run.stage(stage, None if papers is None else len(papers)) as metrics:
+            if stage == "fetch":
+                papers = fetch()
+            elif stage == "dedup":
+                papers = dedup(papers)
+            elif stage == "cite":
+                papers = cite(papers)
+            elif stage == "filter":
+                papers = filter_papers(papers, delta)
+            elif stage == "rank":
+                papers = rank(papers)
+            elif stage == "summarize":
+                papers = summarize(
+                    papers, args.workers, args.threads_per_worker, args.profile,
+                    args.summarizer,
+                )
+            elif stage == "render":
+                papers = render(papers)
+            elif stage == "export":
+                papers = export(papers)
+            save_state(stage, papers)
+            metrics.items_out = len(papers)
+    return papers
+
+
+async def run_pipelined_async(args, delta=False):
+    """Run all stages as a pipeline over batches of papers, return
+    (exported papers, pipeline stats)."""
+    from dedup_index import DedupIndex
+    from eutils import EUtilsClient
+    from pipeline import batched, run_pipeline
+    from sources import merge_papers_async
+
+    async with EUtilsClient() as client:
+        # PubMed sources and citation lookups share the client's rate limiter
+        sources = []
+        for source in paper_sources:
+            if isinstance(source, PubMedSource):
+                source = copy.copy(source)
+                source.bucket = client.bucket
+            sources.append(source)
+        batch_index = DedupIndex(":memory:")  # papers kept so far in the run
+
+        async def dedup_step(papers):
+            # cheap, and on the event loop's thread like batch_index
+            return dedup(papers, batch_index)
+
+        async def cite_step(papers):
+            return await cite_async(client, papers)
+
+        def summarize_step(papers):
+            return summarize(papers, 1, args.threads_per_worker, False, args.summarizer)
+
+        steps = [
+            ("dedup", dedup_step),
+            ("cite", cite_step),
+            ("filter", lambda papers: filter_papers(papers, delta)),
+            ("rank", lambda papers: rank(papers, per_batch=True)),
+            ("summarize", summarize_step),
+            ("render", render),
+            ("export", export),
+        ]
+        papers = merge_papers_async(sources)
+        batches = batched(papers, pipeline_batch_size)
+        try:
+            return await run_pipeline(batches, steps, max_queued=pipeline_max_queued)
+        finally:
+            # a failed step leaves the stream suspended: close it, and the
+            # sources with it, before the client
+            await batches.aclose()
+            await papers.aclose()
+            batch_index.close()
+
+
+def run_pipelined(args, run, delta=False):
+    """Run all stages pipelined, measured as one `pipeline` stage of `run`
+    with the busy seconds and items of each stage, and return the exported
+    papers."""
+    with run.stage("pipeline") as metrics:
+        papers, stats = asyncio.run(run_pipelined_async(args, delta))
+        for name, values in stats.items():
+            if name == "wall_seconds":
+                continue
+            logging.info(
+                f"{name}: {values['seconds']:.2f}s busy, "
+                f"{values['items_in']} -> {values['items_out']} items"
+            )
+            instrumentation.record(f"{name}_busy_seconds", round(values["seconds"], 6))
+            instrumentation.record(f"{name}_items_out", values["items_out"])
+        save_state("export", papers)
+        metrics.items_out = len(papers)
+    return papers
+
+
+def daemon(args):
+    """Run all stages on the delta every `args.interval` seconds, or on
+    SIGUSR1, until SIGTERM/SIGINT, with the models loaded once."""
+    wake, stopping = threading.Event(), threading.Event()
+
+    def on_signal(signum, frame):
+        if signum != getattr(signal, "SIGUSR1", None):
+            logging.info("Stopping after the current run")
+            stopping.set()
+        wake.set()
+
+    for name in ("SIGINT", "SIGTERM", "SIGUSR1"):
+        if hasattr(signal, name):  # no SIGUSR1 on Windows
+            signal.signal(getattr(signal, name), on_signal)
+
+    # warm up: load the segmenter, and the model unless it is never used
+    # (worker processes load their own copy at each run)
+    from sentences import load_segmenter
+
+    load_segmenter()
+    if args.summarizer != "extractive" and args.workers <= 1:
+        from summarize import shared_summarizer
+
+        shared_summarizer(summarizer_model, backend=summarizer_backend)
+    logging.info(f"Reader daemon started (pid {os.getpid()}), running every {args.interval}s")
+
+    while not stopping.is_set():
+        run = instrumentation.Run("reader", report_dir, args.prometheus)
+        try:
+            if args.pipelined:
+                papers = run_pipelined(args, run, delta=True)
+            else:
+                papers = run_stages(stages, args, run, delta=True)
+            logging.info(f"Run done: {len(papers)} new papers exported")
+        except Exception:
+            # e.g. an API outage: the next run retries
+            logging.exception("Run failed")
+        finally:
+            papers = None
+            with run.stage("cleanup"):
+                gc.collect()
+                instrumentation.record("rss_bytes", instrumentation.current_rss())
+            logging.info(f"Run report saved in {run.write()}")
+        wake.wait(args.interval)
+        wake.clear()
+    logging.info("Reader daemon stopped")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Retrieve, summarize and store papers for the writer to tweet."
+    )
+    parser.add_argument(
+        "stages",
+        nargs="*",
+        metavar="stage",
+        help=f"stages to run, in pipeline order: {', '.join(stages)} (default: all)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="summarization worker processes"
+    )
+    parser.add_argument(
+        "--threads-per-worker",
+        type=int,
+        default=None,
+        help="torch threads per summarization worker (default: cores / workers)",
+    )
+    parser.add_argument(
+        "--summarizer",
+        choices=("abstractive", "extractive", "hybrid"),
+        default=summarizer_mode,
+        help=f"summarization mode (default: {summarizer_mode})",
+    )
+    parser.add_argument(
+        "--prometheus",
+        default=prometheus_path,
+        help="also write the run metrics to this Prometheus text file",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"cProfile the summarization loop, stats saved in {profile_path}",
+    )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="run all stages concurrently on batches of papers (summarizes in-process)",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="stay up and run all stages on new papers periodically (or on SIGUSR1)",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=daemon_interval,
+        help=f"seconds between the runs of --daemon (default: {daemon_interval})",
+    )
+    args = parser.parse_args(argv)
+    if (args.daemon or args.pipelined) and args.stages:
+        parser.error("--daemon and --pipelined run all stages, do not list stages")
+    unknown = set(args.stages) - set(stages)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()  # NCBI_API_KEY, if set, raises the E-utilities rate limit
+
+    if args.daemon:
+        return daemon(args)
+    selected = [stage for stage in stages if stage in (args.stages or stages)]
+    run = instrumentation.Run("reader", report_dir, args.prometheus)
+    try:
+        if args.pipelined:
+            run_pipelined(args, run)
+        else:
+            run_stages(selected, args, run)
+    finally:
+        logging.info(f"Run report saved in {run.write()}")
 
 
-# 2.4 Save DataFrame
-df_papers.to_csv(output_path, index=False)
-logging.info(f"DataFrame saved in {output_path}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Record Store
+
+Persistent local store of harvested PubMed records, keyed by PMID, plus
+named harvest watermarks. Backed by SQLite so that each reader run only has
+to download the records added since the previous run (see
+`pubmed.harvest_recent_papers`).
+
+Structure:
+    1. Imports, Variables
+    2. RecordStore
+"""
+# 1. Imports, Variables
+# imports
+import json
+import os
+import sqlite3
+
+# variables
+default_path = os.path.join("..", "results", "pubmed.sqlite")
+max_sql_variables = 500  # PMIDs per IN (...) query
+
+
+# 2. RecordStore
+class RecordStore:
+    """SQLite-backed store of paper dicts, as produced by
+    `pubmed.parse_article`.
+
+    >>> with RecordStore() as store:
+    ...     store.upsert_papers(papers)
+    ...     papers = store.get_papers(pmids)
+    """
+
+    def __init__(self, path=default_path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS papers (
+                pmid INTEGER PRIMARY KEY,
+                title TEXT,
+                link TEXT,
+                doi_link TEXT,
+                keywords TEXT,
+                abstract TEXT
+            );
+            CREATE TABLE IF NOT EXISTS watermarks (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    # papers
+    def upsert_papers(self, papers):
+        """Insert or replace papers, returns the number of rows written."""
+        rows = [
+            (
+                int(paper["pmid"]),
+                paper["title"],
+                paper["link"],
+                paper["doi_link"],
+                json.dumps(paper["keywords"]),
+                paper["abstract"],
+            )
+            for paper in papers
+        ]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO papers VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+        return len(rows)
+
+    def _select(self, columns, pmids):
+        pmids = [int(pmid) for pmid in pmids]
+        for start in range(0, len(pmids), max_sql_variables):
+            chunk = pmids[start : start + max_sql_variables]
+            placeholders = ",".join("?" * len(chunk))
+            yield from self.connection.execute(
+                f"SELECT {columns} FROM papers WHERE pmid IN ({placeholders})", chunk
+            )
+
+    def missing_pmids(self, pmids):
+        """Return the PMIDs of `pmids` that are not in the store, in order."""
+        stored = {row[0] for row in self._select("pmid", pmids)}
+        return [pmid for pmid in pmids if int(pmid) not in stored]
+
+    def get_papers(self, pmids):
+        """Return the stored papers for `pmids`, in the order of `pmids`.
+        PMIDs that are not in the store are skipped."""
+        papers = {}
+        for pmid, title, link, doi_link, keywords, abstract in self._select(
+            "pmid, title, link, doi_link, keywords, abstract", pmids
+        ):
+            papers[pmid] = {
+                "title": title,
+                "pmid": str(pmid),
+                "link": link,
+                "doi_link": doi_link,
+                "keywords": json.loads(keywords),
+                "abstract": abstract,
+            }
+        return [papers[int(pmid)] for pmid in pmids if int(pmid) in papers]
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    # watermarks
+    def get_watermark(self, name):
+        row = self.connection.execute(
+            "SELECT value FROM watermarks WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, name, value):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO watermarks VALUES (?, ?)", (name, value)
+            )
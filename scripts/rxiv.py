@@ -0,0 +1,124 @@
+"""bioRxiv / medRxiv
+
+Asyncio client for the bioRxiv and medRxiv preprint API
+(https://api.biorxiv.org), yielding paper dicts in the same layout as
+`pubmed.parse_article`.
+
+The `details` endpoint returns the preprints posted in a date interval,
+100 per page, paged with a cursor. Every version of a preprint is listed;
+only the latest one is kept. Requests are paced with the same token bucket
+as the E-utilities client and retried on 429/5xx by the same code
+(`eutils.retrying_request`).
+
+Preprints have no PMID. Since the reader, the paper store and the tweet
+queue key papers by `pmid`, preprints get a surrogate key derived from
+their DOI (`preprint_key`): a negative integer, so it can never collide
+with a real PMID.
+
+Structure:
+    1. Imports, Variables
+    2. Client
+    3. Parsing
+    4. Papers
+"""
+# 1. Imports, Variables
+# imports
+import hashlib
+from datetime import datetime, timedelta
+
+import aiohttp
+
+from eutils import TokenBucket, retrying_request
+
+# variables
+base_url = "https://api.biorxiv.org/"
+servers = ("biorxiv", "medrxiv")
+default_rate = 2.0  # requests/s, the API has no documented limit
+page_size = 100  # fixed by the API
+
+
+class RxivError(Exception):
+    """Raised when a bioRxiv/medRxiv request fails after all retries."""
+
+
+# 2. Client
+class RxivClient:
+    """Pooled, rate-limited client of the bioRxiv/medRxiv API.
+
+    >>> async with RxivClient() as client:
+    ...     page = await client.details("biorxiv", "2024-01-01", "2024-01-31", 0)
+    """
+
+    def __init__(self, rate=default_rate, max_retries=5, backoff=1.0, timeout=60, base_url=base_url):
+        self.bucket = TokenBucket(rate)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.base_url = base_url
+        self.session = None
+        self.n_requests = 0
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def details(self, server, start_date, end_date, cursor=0, category=None):
+        """One page of the `details` endpoint, as parsed JSON."""
+        url = f"{self.base_url}details/{server}/{start_date}/{end_date}/{cursor}"
+        params = {"category": category} if category else {}
+        return await retrying_request(
+            self, server, "GET", url, lambda response: response.json(content_type=None),
+            RxivError, params=params,
+        )
+
+
+# 3. Parsing
+def preprint_key(doi):
+    """Surrogate paper key of a preprint: a negative 62-bit integer hash of
+    its DOI, as a string like the PMIDs of PubMed papers."""
+    digest = hashlib.sha256(doi.lower().encode()).digest()
+    return str(-(int.from_bytes(digest[:8], "big") >> 2) - 1)
+
+
+def parse_preprint(item, server):
+    """Extract the paper dict from an item of a `details` collection."""
+    doi = item["doi"]
+    return {
+        "title": item.get("title"),
+        "pmid": preprint_key(doi),
+        "link": f"https://www.{server}.org/content/{doi}v{item.get('version', 1)}",
+        "doi_link": f"https://doi.org/{doi}",
+        "keywords": [item["category"]] if item.get("category") else [],
+        "abstract": item.get("abstract") or None,
+        "source": server,
+    }
+
+
+# 4. Papers
+async def iter_recent_preprints_async(client, server, days_ago=30, categories=None):
+    """
+    Yield the preprints posted on `server` in the last `days_ago` days,
+    latest version only, optionally restricted to `categories` (e.g.
+    ["bioinformatics"]).
+    """
+    end_date = datetime.today()
+    start_date = end_date - timedelta(days=days_ago)
+    start_str, end_str = start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")
+    for category in categories or [None]:
+        latest = {}  # doi -> item, versions are listed oldest first
+        cursor, total = 0, None
+        while total is None or cursor < total:
+            content = await client.details(server, start_str, end_str, cursor, category)
+            messages = content.get("messages") or [{}]
+            collection = content.get("collection") or []
+            if messages[0].get("status", "ok") != "ok" or not collection:
+                break
+            total = int(messages[0].get("total", 0))
+            for item in collection:
+                latest[item["doi"]] = item
+            cursor += len(collection)
+        for item in latest.values():
+            yield parse_preprint(item, server)
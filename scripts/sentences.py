@@ -0,0 +1,76 @@
+"""Sentences
+
+Sentence trimming of model summaries. BART stops at `max_length` tokens,
+usually in the middle of a sentence, so the trailing partial sentence is
+dropped:
+    - more than one sentence: keep all but the last one,
+    - a single sentence: keep it,
+    - no sentence: None.
+
+Sentences are detected with spaCy's rule-based sentencizer on a blank
+English pipeline, loaded on first use, instead of the full en_core_web_sm
+pipeline (tagger, parser, NER), and all summaries go through one batched
+`nlp.pipe` pass.
+
+Structure:
+    1. Imports, Variables
+    2. Functions
+"""
+# 1. Imports, Variables
+# imports
+import logging
+
+# variables
+max_segmenter_strings = 500_000  # rebuild the segmenter past this many interned strings
+_segmenter = None
+
+
+# 2. Functions
+def load_segmenter():
+    """
+    Return the shared sentence segmenter, building it on first use.
+
+    spaCy interns every token string it sees and never frees them, so in a
+    long-running process the segmenter is rebuilt (cheaply, it is a blank
+    pipeline) once its string store grows past `max_segmenter_strings`.
+    """
+    global _segmenter
+    if _segmenter is None or len(_segmenter.vocab.strings) > max_segmenter_strings:
+        import spacy
+
+        _segmenter = spacy.blank("en")
+        _segmenter.add_pipe("sentencizer")
+    return _segmenter
+
+
+def trim_sentences(sentences):
+    """
+    Apply the trimming rules to the list of sentences of one summary.
+    """
+    if len(sentences) > 1:
+        # Join all sentences except the last incomplete one
+        return " ".join(sentence.text for sentence in sentences[:-1])
+    elif len(sentences) == 1:
+        return sentences[0].text
+    else:
+        # No sentences detected, unlikely but handled
+        logging.info("No sentences detected in the summary.")
+        return None
+
+
+def trim_summaries(summaries, batch_size=256):
+    """
+    Trim a list of summaries in one batched pass. None entries (papers
+    without abstract) stay None; order is preserved.
+    """
+    summaries = list(summaries)
+    positions = [i for i, summary in enumerate(summaries) if summary is not None]
+    trimmed = [None] * len(summaries)
+    if not positions:
+        return trimmed
+    docs = load_segmenter().pipe(
+        (summaries[i] for i in positions), batch_size=batch_size
+    )
+    for i, doc in zip(positions, docs):
+        trimmed[i] = trim_sentences(list(doc.sents))
+    return trimmed
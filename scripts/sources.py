@@ -0,0 +1,197 @@
+"""Sources
+
+Paper sources of the reader, behind one interface, so that every source
+feeds the same filter/summarize/render/export pipeline instead of each
+having its own copy of the reader script.
+
+A source is a small object with a `name` and an async generator
+`iter_papers()`, yielding paper dicts in the common record layout:
+    title, pmid, link, doi_link, keywords, abstract, source
+`pmid` is the paper key downstream: the PMID for PubMed papers, a
+surrogate key for papers without one (see `rxiv.preprint_key`). Each
+source opens and closes its own API client.
+
+`fetch_papers` runs all configured sources concurrently on one event loop
+and merges their streams as papers arrive; a paper yielded by several
+sources is kept once, first come first served.
+
+    >>> papers = fetch_papers([
+    ...     PubMedSource(query, days_ago=90),
+    ...     RxivSource("biorxiv", days_ago=30, categories=["bioinformatics"]),
+    ... ])
+
+Structure:
+    1. Imports, Variables
+    2. Sources
+    3. Merging
+"""
+# 1. Imports, Variables
+# imports
+import asyncio
+import logging
+
+# variables
+_done = object()  # end of stream marker of a source
+
+
+# 2. Sources
+class Source:
+    """Interface of a paper source."""
+
+    name = "source"
+
+    def iter_papers(self):
+        """Async generator of paper dicts in the common record layout."""
+        raise NotImplementedError
+
+
+class PubMedSource(Source):
+    """Papers of a PubMed query published in the last `days_ago` days.
+
+    With `record_store_path`, records are harvested incrementally and
+    streamed as each page is stored (see `pubmed.iter_harvest_papers_async`),
+    the window's other papers following from the store; otherwise they are streamed
+    `page_size` records per efetch request, or fetched with a single efetch
+    if `page_size` is None. With `shard_queries` (the clauses OR-ed in
+    `query`, e.g. one per journal), the search is run by shard of
+    `shard_days` days (see `pubmed.plan_shards`). With `bucket`, the
+    client shares that rate limiter (see `eutils.EUtilsClient`).
+    """
+
+    name = "pubmed"
+
+    def __init__(
+        self,
+        query,
+        days_ago=90,
+        page_size=500,
+        record_store_path=None,
+        shard_queries=None,
+        shard_days=None,
+        base_url=None,
+        bucket=None,
+    ):
+        self.query = query
+        self.days_ago = days_ago
+        self.page_size = page_size
+        self.record_store_path = record_store_path
+        self.shard_queries = shard_queries
+        self.shard_days = shard_days
+        self.base_url = base_url  # None for NCBI, or a stand-in server
+        self.bucket = bucket
+
+    async def iter_papers(self):
+        import pubmed
+        from eutils import EUtilsClient
+
+        client_kwargs = {"base_url": self.base_url} if self.base_url else {}
+        client_kwargs["bucket"] = self.bucket
+        async with EUtilsClient(**client_kwargs) as client:
+            if self.record_store_path:
+                from record_store import RecordStore
+
+                with RecordStore(self.record_store_path) as store:
+                    async for paper in pubmed.iter_harvest_papers_async(
+                        client, store, self.query, self.days_ago,
+                        self.page_size or pubmed.efetch_page_size,
+                        self.shard_queries, self.shard_days,
+                    ):
+                        yield dict(paper, source=self.name)
+                return
+            if self.shard_queries:
+                papers = pubmed.iter_sharded_papers_async(
+                    client,
+                    pubmed.plan_shards(self.shard_queries, self.days_ago, self.shard_days),
+                    self.page_size or pubmed.efetch_page_size,
+                )
+            elif self.page_size:
+                papers = pubmed.iter_recent_papers_async(
+                    client, self.query, self.days_ago, self.page_size
+                )
+            else:
+                papers = await pubmed.fetch_recent_papers_async(
+                    client, self.query, self.days_ago
+                )
+            if isinstance(papers, list):
+                for paper in papers:
+                    yield dict(paper, source=self.name)
+            else:
+                async for paper in papers:
+                    yield dict(paper, source=self.name)
+
+
+class RxivSource(Source):
+    """Preprints posted on bioRxiv or medRxiv (`server`) in the last
+    `days_ago` days, optionally restricted to `categories`."""
+
+    def __init__(self, server="biorxiv", days_ago=30, categories=None, base_url=None):
+        self.name = server
+        self.server = server
+        self.days_ago = days_ago
+        self.categories = categories
+        self.base_url = base_url  # None for api.biorxiv.org, or a stand-in server
+
+    async def iter_papers(self):
+        from rxiv import RxivClient, iter_recent_preprints_async
+
+        client_kwargs = {"base_url": self.base_url} if self.base_url else {}
+        async with RxivClient(**client_kwargs) as client:
+            async for paper in iter_recent_preprints_async(
+                client, self.server, self.days_ago, self.categories
+            ):
+                yield paper
+
+
+# 3. Merging
+async def merge_papers_async(sources, max_buffered=1000):
+    """
+    Run `sources` concurrently and yield their papers as they arrive,
+    skipping papers already yielded by another source. If a source fails,
+    the others are cancelled and its error is raised.
+    """
+    queue = asyncio.Queue(maxsize=max_buffered)
+    counts = {source.name: 0 for source in sources}
+
+    async def produce(source):
+        # no end marker once cancelled: the consumer is gone, and a put on
+        # the full queue would block forever
+        try:
+            async for paper in source.iter_papers():
+                await queue.put(paper)
+                counts[source.name] += 1
+        except Exception as error:
+            await queue.put(error)
+            return
+        await queue.put(_done)
+
+    tasks = [asyncio.create_task(produce(source)) for source in sources]
+    seen = set()
+    try:
+        n_running = len(tasks)
+        while n_running:
+            paper = await queue.get()
+            if paper is _done:
+                n_running -= 1
+                continue
+            if isinstance(paper, Exception):
+                raise paper
+            if paper["pmid"] in seen:
+                continue
+            seen.add(paper["pmid"])
+            yield paper
+    finally:
+        for task in tasks:
+            task.cancel()
+        # let the cancelled sources close their clients
+        await asyncio.gather(*tasks, return_exceptions=True)
+    logging.info(f"Papers per source: {counts}")
+
+
+async def fetch_papers_async(sources):
+    return [paper async for paper in merge_papers_async(sources)]
+
+
+def fetch_papers(sources):
+    """Papers of all `sources`, fetched concurrently and merged.
+    Raises the error of the first failing source (e.g. EUtilsError)."""
+    return asyncio.run(fetch_papers_async(sources))
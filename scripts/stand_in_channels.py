@@ -0,0 +1,203 @@
+"""Stand-in Channels
+
+Local stand-in for the posting APIs of the publisher's channels, so that
+posting throughput and failure handling can be tested offline:
+    - X:        POST /2/tweets (OAuth 1.0a header required)
+    - Mastodon: POST /api/v1/statuses (bearer token, Idempotency-Key)
+    - Bluesky:  POST /xrpc/com.atproto.server.createSession and
+                POST /xrpc/com.atproto.repo.createRecord
+Like the E-utilities stand-in (stand_in_server.py), every request can be
+delayed (`latency`, `jitter`) and a share of them answered with 429/503
+errors (`error_rate`). Each API also enforces a rate limit of
+`rate_limit` posts/s (429 with a Retry-After header), and X rejects a
+text already posted by the same account (403), like the real API.
+Posts over an API's length limit are rejected as the real APIs do:
+    - X:        280, weighted like twitter-text, links count 23 (403)
+    - Mastodon: 500 characters, links count 23 (422)
+    - Bluesky:  300 characters, links count in full (400)
+
+Posts are kept in memory, per API and account, in `posts`.
+
+Usage:
+    python stand_in_channels.py --port 8766 --latency 0.3 --error-rate 0.1
+    # then point the channels' base_url at "http://127.0.0.1:8766/"
+
+Structure:
+    1. Imports, Variables
+    2. Server
+    3. Main
+"""
+# 1. Imports, Variables
+# imports
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import re
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+# variables
+length_limits = {"x": (280, 23), "mastodon": (500, 23), "bluesky": (300, None)}
+
+
+def too_long(api, text):
+    """Whether `text` is over the length limit of `api`."""
+    from tweet_render import url_pattern, weighted_length_of
+
+    limit, url_length = length_limits[api]
+    if api == "x":
+        return weighted_length_of(text, url_length) > limit
+    if url_length is not None:
+        text = re.sub(url_pattern, "x" * url_length, text)
+    return len(text) > limit
+
+
+# 2. Server
+class StandInChannels:
+    """aiohttp application standing in for the X, Mastodon and Bluesky
+    posting APIs.
+
+    >>> channels = StandInChannels(latency=0.1, error_rate=0.05)
+    >>> base_url = await channels.start()
+    >>> ...
+    >>> await channels.stop()
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=0, rate_limit=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit  # posts/s per API, None for no limit
+        self.random = random.Random(seed)
+        self.ids = itertools.count(1)
+        self.posts = defaultdict(list)  # (api, account) -> texts
+        self.idempotency = {}  # Mastodon Idempotency-Key -> response body
+        self.last_post = {}  # api -> time of its last accepted post
+        self.n_requests = 0
+        self.n_errors = 0
+        self.runner = None
+        self.app = web.Application()
+        self.app.router.add_post("/2/tweets", self.tweet)
+        self.app.router.add_post("/api/v1/statuses", self.status)
+        self.app.router.add_post("/xrpc/com.atproto.server.createSession", self.create_session)
+        self.app.router.add_post("/xrpc/com.atproto.repo.createRecord", self.create_record)
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving and return the base URL for the channels."""
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}/"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def delay_or_fail(self, api):
+        """Simulate latency, injected errors and the rate limit of `api`;
+        return an error response or None."""
+        self.n_requests += 1
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.random.random() < self.error_rate:
+            self.n_errors += 1
+            return web.Response(status=self.random.choice((429, 503)))
+        if self.rate_limit:
+            now = time.monotonic()
+            if now - self.last_post.get(api, -1e9) < 1 / self.rate_limit:
+                self.n_errors += 1
+                return web.Response(status=429, headers={"Retry-After": "1"})
+            self.last_post[api] = now
+        return None
+
+    def token(self, request):
+        """Bearer token of `request`, or None."""
+        authorization = request.headers.get("Authorization", "")
+        return authorization[len("Bearer "):] if authorization.startswith("Bearer ") else None
+
+    async def tweet(self, request):
+        authorization = request.headers.get("Authorization", "")
+        if not authorization.startswith("OAuth ") or "oauth_signature=" not in authorization:
+            return web.json_response({"title": "Unauthorized"}, status=401)
+        error = await self.delay_or_fail("x")
+        if error:
+            return error
+        account = authorization.split('oauth_token="', 1)[-1].split('"', 1)[0]
+        text = (await request.json())["text"]
+        if text in self.posts["x", account]:
+            return web.json_response({"detail": "duplicate content"}, status=403)
+        if too_long("x", text):
+            return web.json_response({"detail": "Tweet text is too long"}, status=403)
+        self.posts["x", account].append(text)
+        return web.json_response({"data": {"id": str(next(self.ids)), "text": text}}, status=201)
+
+    async def status(self, request):
+        account = self.token(request)
+        if account is None:
+            return web.json_response({"error": "The access token is invalid"}, status=401)
+        key = request.headers.get("Idempotency-Key")
+        if key in self.idempotency:  # a retry of a post that went through
+            return web.json_response(self.idempotency[key])
+        error = await self.delay_or_fail("mastodon")
+        if error:
+            return error
+        text = (await request.post())["status"]
+        if too_long("mastodon", text):
+            return web.json_response(
+                {"error": "Validation failed: Text character limit of 500 exceeded"}, status=422
+            )
+        self.posts["mastodon", account].append(text)
+        body = {"id": str(next(self.ids)), "content": text}
+        if key:
+            self.idempotency[key] = body
+        return web.json_response(body)
+
+    async def create_session(self, request):
+        credentials = await request.json()
+        if not credentials.get("identifier") or not credentials.get("password"):
+            return web.json_response({"error": "AuthenticationRequired"}, status=401)
+        did = f"did:plc:{credentials['identifier']}"
+        return web.json_response({"did": did, "accessJwt": did})
+
+    async def create_record(self, request):
+        account = self.token(request)
+        if account is None:
+            return web.json_response({"error": "AuthenticationRequired"}, status=401)
+        error = await self.delay_or_fail("bluesky")
+        if error:
+            return error
+        record = (await request.json())["record"]
+        if too_long("bluesky", record["text"]):
+            return web.json_response(
+                {"error": "InvalidRequest", "message": "Record/text must not be longer than 300 graphemes"},
+                status=400,
+            )
+        self.posts["bluesky", account].append(record["text"])
+        uri = f"at://{account}/app.bsky.feed.post/{next(self.ids)}"
+        return web.json_response({"uri": uri, "cid": uri})
+
+
+# 3. Main
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Local stand-in for the X, Mastodon and Bluesky posting APIs.")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 429/503 responses")
+    parser.add_argument("--rate-limit", type=float, default=None, help="posts/s per API")
+    args = parser.parse_args()
+
+    channels = StandInChannels(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+    )
+    web.run_app(channels.app, host="127.0.0.1", port=args.port)
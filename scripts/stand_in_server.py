@@ -0,0 +1,346 @@
+"""Stand-in Server
+
+Local stand-in for the NCBI E-utilities (esearch, efetch, elink) and the
+bioRxiv/medRxiv `details` API, so the reader and the benchmarks can run
+offline.
+
+Responses are rendered in the E-utilities XML formats from recorded PubMed
+records: by default the papers stored in results/papers_to_tweet.csv
+(title, PMID, DOI, keywords, abstract and citation count). `scale` repeats
+them under new PMIDs to simulate larger date windows. Every request can be
+delayed (`latency`, `jitter`) and a share of them answered with 429/503
+errors (`error_rate`) to exercise the client's retries. The same records are
+also served as preprints (`preprint_items`), under bioRxiv-style DOIs and
+with a second version for every other one.
+
+Usage:
+    python stand_in_server.py --port 8765 --latency 0.2 --error-rate 0.05
+    # then point EUtilsClient(base_url="http://127.0.0.1:8765/") or
+    # RxivClient(base_url="http://127.0.0.1:8765/") at it
+
+Structure:
+    1. Imports, Variables
+    2. Records
+    3. Responses
+    4. Server
+    5. Main
+"""
+# 1. Imports, Variables
+# imports
+import argparse
+import ast
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+from aiohttp import web
+
+# variables
+default_records_path = os.path.join("..", "results", "papers_to_tweet.csv")
+pmid_offset = 90000000  # PMIDs of scaled copies start here
+rxiv_page_size = 100
+servers = ("biorxiv", "medrxiv")
+esearch_cap = 9999  # like PubMed, no record past the 9999th can be retrieved
+
+
+# 2. Records
+def load_records(path_csv=default_records_path, scale=1):
+    """
+    Load recorded papers as dicts with pmid (int), title, doi, keywords,
+    abstract and citations. With `scale` > 1 the records are repeated under
+    new PMIDs.
+    """
+    import pandas as pd
+
+    df_papers = pd.read_csv(path_csv)
+    base = []
+    for row in df_papers.itertuples():
+        doi_link = row.doi_link if isinstance(row.doi_link, str) else ""
+        base.append(
+            {
+                "pmid": int(row.pmid),
+                "title": row.title if isinstance(row.title, str) else "",
+                "doi": doi_link.removeprefix("https://doi.org/") if doi_link.startswith("https://doi.org/") else None,
+                "keywords": ast.literal_eval(row.keywords) if isinstance(row.keywords, str) else [],
+                "abstract": row.abstract if isinstance(row.abstract, str) else None,
+                "citations": int(row.citations),
+            }
+        )
+    records = list(base)
+    for copy in range(1, scale):
+        records += [
+            dict(record, pmid=pmid_offset + copy * len(base) + i)
+            for i, record in enumerate(base)
+        ]
+    return records
+
+
+# 3. Responses
+def article_xml(record):
+    """One PubmedArticle element, in the efetch rettype=abstract layout."""
+    keywords = "".join(
+        f'<Keyword MajorTopicYN="N">{escape(keyword)}</Keyword>'
+        for keyword in record["keywords"]
+    )
+    abstract = (
+        f"<Abstract><AbstractText>{escape(record['abstract'])}</AbstractText></Abstract>"
+        if record["abstract"]
+        else ""
+    )
+    doi = (
+        f'<ArticleId IdType="doi">{escape(record["doi"])}</ArticleId>'
+        if record["doi"]
+        else ""
+    )
+    return (
+        "<PubmedArticle>"
+        f'<MedlineCitation Status="MEDLINE" Owner="NLM"><PMID Version="1">{record["pmid"]}</PMID>'
+        f"<Article><ArticleTitle>{escape(record['title'])}</ArticleTitle>{abstract}</Article>"
+        f'<KeywordList Owner="NOTNLM">{keywords}</KeywordList>'
+        "</MedlineCitation>"
+        f'<PubmedData><ArticleIdList><ArticleId IdType="pubmed">{record["pmid"]}</ArticleId>{doi}</ArticleIdList></PubmedData>'
+        "</PubmedArticle>"
+    )
+
+
+def efetch_xml(records):
+    return (
+        '<?xml version="1.0" ?>\n<!DOCTYPE PubmedArticleSet PUBLIC "-//NLM//DTD PubMedArticle, 1st January 2024//EN" '
+        '"https://dtd.nlm.nih.gov/ncbi/pubmed/out/pubmed_240101.dtd">\n'
+        "<PubmedArticleSet>" + "".join(article_xml(r) for r in records) + "</PubmedArticleSet>"
+    )
+
+
+def esearch_xml(count, ids=(), webenv=None):
+    history = (
+        f"<QueryKey>1</QueryKey><WebEnv>{webenv}</WebEnv>" if webenv else ""
+    )
+    id_list = "".join(f"<Id>{pmid}</Id>" for pmid in ids)
+    return (
+        '<?xml version="1.0" encoding="UTF-8" ?>\n'
+        f"<eSearchResult><Count>{count}</Count><RetMax>{len(ids)}</RetMax>"
+        f"<RetStart>0</RetStart>{history}<IdList>{id_list}</IdList></eSearchResult>"
+    )
+
+
+def elink_xml(pmids, citations):
+    linksets = []
+    for pmid in pmids:
+        n_citations = citations.get(pmid)
+        if n_citations is None:
+            continue  # unknown PMID: no LinkSet, like ELink
+        links = "".join(f"<Link><Id>{pmid_offset - 1 - i}</Id></Link>" for i in range(n_citations))
+        linkset_db = (
+            f"<LinkSetDb><DbTo>pubmed</DbTo><LinkName>pubmed_pubmed_citedin</LinkName>{links}</LinkSetDb>"
+            if n_citations
+            else ""
+        )
+        linksets.append(
+            f"<LinkSet><DbFrom>pubmed</DbFrom><IdList><Id>{pmid}</Id></IdList>{linkset_db}</LinkSet>"
+        )
+    return '<?xml version="1.0" encoding="UTF-8" ?>\n<eLinkResult>' + "".join(linksets) + "</eLinkResult>"
+
+
+def preprint_items(records, server="biorxiv", date="2024-01-02"):
+    """`details` collection items for `records`, oldest version first."""
+    items = []
+    for i, record in enumerate(records):
+        item = {
+            "doi": f"10.1101/2024.{servers.index(server) + 1:02d}.{i:06d}",
+            "title": record["title"],
+            "authors": "Doe, J.; Roe, R.",
+            "date": date,
+            "version": "1",
+            "type": "new results",
+            "category": "bioinformatics",
+            "abstract": record["abstract"] or "",
+            "published": "NA",
+            "server": server,
+        }
+        items.append(item)
+        if i % 2:
+            items.append(dict(item, version="2"))
+    return items
+
+
+def details_json(items, cursor, total):
+    message = {"status": "ok", "cursor": cursor, "count": len(items), "total": total}
+    if not items:
+        message = {"status": "no posts found"}
+    return json.dumps({"messages": [message], "collection": items})
+
+
+# 4. Server
+class StandInServer:
+    """aiohttp application replaying `records` as E-utilities and
+    bioRxiv/medRxiv responses.
+
+    >>> server = StandInServer(load_records(), latency=0.1)
+    >>> base_url = await server.start()
+    >>> ...
+    >>> await server.stop()
+    """
+
+    def __init__(
+        self, records, latency=0.0, jitter=0.0, error_rate=0.0, seed=0, journals=None, days=460
+    ):
+        # every record gets a journal (round-robin over `journals`) and a
+        # publication date (spread over the last `days` days) to search on
+        journals = journals or ["Stand-in Journal"]
+        today = datetime.today().date()
+        records = [
+            dict(
+                record,
+                journal=journals[i % len(journals)],
+                date=today - timedelta(days=i * days // max(len(records), 1)),
+            )
+            for i, record in enumerate(records)
+        ]
+        self.records = records
+        self.histories = {}  # WebEnv -> records of the search
+        self.by_pmid = {record["pmid"]: record for record in records}
+        self.citations = {record["pmid"]: record["citations"] for record in records}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.n_requests = 0
+        self.n_errors = 0
+        self.preprints = {server: preprint_items(records, server) for server in servers}
+        self.runner = None
+        self.app = web.Application()
+        self.app.router.add_route("*", "/esearch.fcgi", self.esearch)
+        self.app.router.add_route("*", "/efetch.fcgi", self.efetch)
+        self.app.router.add_route("*", "/elink.fcgi", self.elink)
+        self.app.router.add_get("/details/{server}/{start}/{end}/{cursor}", self.details)
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving and return the base URL for EUtilsClient and RxivClient."""
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}/"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def params(self, request):
+        """Query and form parameters, as a MultiDict."""
+        params = request.query.copy()
+        if request.method == "POST":
+            params.extend(await request.post())
+        return params
+
+    async def delay_or_fail(self):
+        """Simulate latency; return an error response or None."""
+        self.n_requests += 1
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.random.random() < self.error_rate:
+            self.n_errors += 1
+            return web.Response(status=self.random.choice((429, 503)))
+        return None
+
+    def xml(self, body):
+        return web.Response(body=body.encode(), content_type="text/xml")
+
+    def search(self, term):
+        """Records matching the `[Journal]` and `[Date - Publication]`
+        clauses of `term`; other clauses are ignored."""
+        records = self.records
+        journals = set(re.findall(r'"([^"]+)"\[Journal\]', term))
+        if journals:
+            records = [r for r in records if r["journal"] in journals]
+        date_range = re.search(
+            r'"(\d{4}/\d{2}/\d{2})"\[Date - Publication\] : "(\d{4}/\d{2}/\d{2})"', term
+        )
+        if date_range:
+            start, end = (datetime.strptime(d, "%Y/%m/%d").date() for d in date_range.groups())
+            records = [r for r in records if start <= r["date"] <= end]
+        return records
+
+    async def esearch(self, request):
+        error = await self.delay_or_fail()
+        if error:
+            return error
+        params = await self.params(request)
+        retstart = int(params.get("retstart", 0))
+        retmax = int(params.get("retmax", 20))
+        records = self.search(params.get("term", ""))
+        webenv = None
+        if params.get("usehistory") == "y":
+            # the history keeps every record; the listed ids stop at the cap
+            webenv = f"STANDIN{len(self.histories)}"
+            self.histories[webenv] = records
+            retmax = min(retmax, esearch_cap + 1 - retstart)
+        elif retstart + retmax > esearch_cap + 1:
+            return self.xml("<eSearchResult><ERROR>Search Backend failed</ERROR></eSearchResult>")
+        ids = [r["pmid"] for r in records[retstart : retstart + retmax]]
+        return self.xml(esearch_xml(len(records), ids, webenv))
+
+    async def efetch(self, request):
+        error = await self.delay_or_fail()
+        if error:
+            return error
+        params = await self.params(request)
+        if "id" in params:
+            pmids = [int(pmid) for pmid in params["id"].split(",")]
+            records = [self.by_pmid[pmid] for pmid in pmids if pmid in self.by_pmid]
+        else:
+            retstart = int(params.get("retstart", 0))
+            retmax = int(params.get("retmax", 20))
+            if retstart >= esearch_cap + 1:
+                return web.Response(status=400, text="Cannot fetch past record 9999")
+            records = self.histories.get(params.get("WebEnv"), [])[retstart : retstart + retmax]
+        return self.xml(efetch_xml(records))
+
+    async def elink(self, request):
+        error = await self.delay_or_fail()
+        if error:
+            return error
+        params = await self.params(request)
+        pmids = [int(pmid) for value in params.getall("id", []) for pmid in value.split(",")]
+        return self.xml(elink_xml(pmids, self.citations))
+
+    async def details(self, request):
+        error = await self.delay_or_fail()
+        if error:
+            return error
+        items = self.preprints.get(request.match_info["server"], [])
+        category = request.query.get("category")
+        if category:
+            items = [item for item in items if item["category"] == category]
+        cursor = int(request.match_info["cursor"])
+        page = items[cursor : cursor + rxiv_page_size]
+        return web.Response(
+            text=details_json(page, cursor, len(items)), content_type="application/json"
+        )
+
+
+# 5. Main
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Local stand-in for the NCBI E-utilities and bioRxiv/medRxiv.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--records", default=default_records_path)
+    parser.add_argument("--scale", type=int, default=1, help="repeat the records N times")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 429/503 responses")
+    args = parser.parse_args()
+
+    server = StandInServer(
+        load_records(args.records, args.scale),
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+    )
+    web.run_app(server.app, host="127.0.0.1", port=args.port)
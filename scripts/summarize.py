@@ -0,0 +1,236 @@
+"""Summarize
+
+Batched abstract summarization with a Hugging Face `pipeline("summarization")`.
+
+Abstracts are tokenized once with the model's fast tokenizer, sorted by
+token length and sent to the pipeline `batch_size` at a time, so each batch
+holds abstracts of similar length and padding stays small. Inputs longer
+than the model's limit are truncated by the tokenizer. Summaries come back
+in the original order.
+
+Three inference backends are available for CPU-only hosts:
+    - "torch": PyTorch fp32, the default,
+    - "int8": PyTorch with dynamic int8 quantization of the Linear layers,
+    - "onnx": ONNX Runtime, through optimum. The model is exported once next
+      to the original one (`<model>-onnx`) and reused afterwards.
+The backends do not produce identical summaries; bench_backends.py reports
+their latency, peak RSS and ROUGE drift against fp32.
+
+On hosts with many cores, `iter_sharded_summary_batches` shards the
+abstracts across worker processes that each load the model once, with
+their torch intra-op threads pinned so that workers x threads does not
+oversubscribe the CPU.
+
+Structure:
+    1. Imports, Variables
+    2. Functions
+    3. Sharded Summarization
+"""
+# 1. Imports, Variables
+# imports
+from collections import defaultdict
+import logging
+import multiprocessing
+import os
+import time
+
+# variables
+summary_batch_size = 8  # abstracts per forward pass
+summarizer_backends = ("torch", "int8", "onnx")
+_worker_summarizer = None  # pipeline of a sharded summarization worker
+_shared_summarizers = {}  # (model, backend): pipeline, kept by long-running processes
+
+
+# 2. Functions
+def load_summarizer(model, backend="torch"):
+    """
+    Build the summarization pipeline with the model's fast tokenizer, on
+    one of `summarizer_backends`.
+    """
+    from transformers import AutoTokenizer, pipeline
+
+    tokenizer = AutoTokenizer.from_pretrained(model, use_fast=True)
+    if backend == "torch":
+        return pipeline("summarization", model=model, tokenizer=tokenizer)
+
+    elif backend == "int8":
+        import torch
+        from transformers import AutoModelForSeq2SeqLM
+
+        seq2seq = AutoModelForSeq2SeqLM.from_pretrained(model)
+        seq2seq = torch.quantization.quantize_dynamic(
+            seq2seq, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        return pipeline("summarization", model=seq2seq, tokenizer=tokenizer)
+
+    elif backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+        onnx_path = model.rstrip("/\\") + "-onnx"
+        if os.path.isdir(onnx_path):
+            seq2seq = ORTModelForSeq2SeqLM.from_pretrained(onnx_path)
+        else:
+            logging.info(f"Exporting {model} to ONNX in {onnx_path}")
+            seq2seq = ORTModelForSeq2SeqLM.from_pretrained(model, export=True)
+            seq2seq.save_pretrained(onnx_path)
+        return pipeline("summarization", model=seq2seq, tokenizer=tokenizer)
+
+    raise ValueError(
+        f"Unknown summarizer backend {backend!r}, expected one of {summarizer_backends}"
+    )
+
+
+def shared_summarizer(model, backend="torch"):
+    """
+    Return the process-wide pipeline of `model` on `backend`, loading it on
+    first use, so a long-running reader keeps the model warm between runs.
+    """
+    key = (model, backend)
+    if key not in _shared_summarizers:
+        _shared_summarizers[key] = load_summarizer(model, backend=backend)
+    return _shared_summarizers[key]
+
+
+def summarizer_id(model, backend="torch"):
+    """
+    Identifier of a model and backend, used in summary cache keys so that
+    summaries of different backends are not mixed up.
+    """
+    return model if backend == "torch" else f"{model}:{backend}"
+
+
+def max_input_length(summarizer):
+    """
+    Longest input, in tokens, the summarizer's model accepts.
+    """
+    max_length = summarizer.tokenizer.model_max_length
+    # tokenizers without a limit report a huge sentinel value
+    if max_length > 100000:
+        max_length = summarizer.model.config.max_position_embeddings
+    return max_length
+
+
+def length_buckets(summarizer, texts, batch_size=summary_batch_size):
+    """
+    Return the positions of `texts` grouped in batches of similar token
+    length, longest first (so an out-of-memory error shows up right away).
+    """
+    input_ids = summarizer.tokenizer(
+        list(texts), truncation=True, max_length=max_input_length(summarizer)
+    )["input_ids"]
+    order = sorted(range(len(texts)), key=lambda i: len(input_ids[i]), reverse=True)
+    return [order[start : start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def iter_summary_batches(summarizer, texts, batch_size=summary_batch_size, **generation_params):
+    """
+    Summarize `texts` in length-bucketed batches, yielding a list of
+    (position, summary) pairs per batch so that callers can checkpoint as
+    they go.
+    """
+    texts = list(texts)
+    if not texts:
+        return
+    for batch in length_buckets(summarizer, texts, batch_size):
+        outputs = summarizer(
+            [texts[i] for i in batch],
+            batch_size=len(batch),
+            truncation=True,
+            **generation_params,
+        )
+        yield [(i, output["summary_text"]) for i, output in zip(batch, outputs)]
+
+
+def summarize_batched(summarizer, texts, batch_size=summary_batch_size, **generation_params):
+    """
+    Summarize `texts` in length-bucketed batches. Returns the summaries in
+    the order of `texts`.
+    """
+    texts = list(texts)
+    summaries = [None] * len(texts)
+    for batch in iter_summary_batches(summarizer, texts, batch_size, **generation_params):
+        for i, summary in batch:
+            summaries[i] = summary
+    logging.info(f"Summarized {len(texts)} abstracts in batches of {batch_size}")
+    return summaries
+
+
+# 3. Sharded Summarization
+def _init_worker(model, backend, threads):
+    """Pin torch threads and load the model once per worker process."""
+    global _worker_summarizer
+    import torch
+
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    _worker_summarizer = load_summarizer(model, backend=backend)
+
+
+def _summarize_shard(shard):
+    positions, texts, batch_size, generation_params = shard
+    start = time.perf_counter()
+    summaries = [None] * len(texts)
+    for batch in iter_summary_batches(
+        _worker_summarizer, texts, batch_size, **generation_params
+    ):
+        for i, summary in batch:
+            summaries[i] = summary
+    return os.getpid(), list(zip(positions, summaries)), time.perf_counter() - start
+
+
+def iter_sharded_summary_batches(
+    model,
+    texts,
+    n_workers,
+    threads_per_worker=None,
+    backend="torch",
+    batch_size=summary_batch_size,
+    start_method="spawn",
+    **generation_params,
+):
+    """
+    Summarize `texts` across `n_workers` processes, yielding a list of
+    (position, summary) pairs per finished shard, like
+    `iter_summary_batches`.
+
+    Texts are sorted by length and cut into shards of a few batches, so
+    each worker still batches abstracts of similar length and faster
+    workers pick up more shards. `threads_per_worker` defaults to an even
+    share of the CPU cores. Per-worker throughput is logged at the end.
+    """
+    texts = list(texts)
+    if not texts:
+        return
+    threads_per_worker = threads_per_worker or max(1, os.cpu_count() // n_workers)
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    shard_size = 4 * batch_size
+    shards = [
+        (
+            positions,
+            [texts[i] for i in positions],
+            batch_size,
+            generation_params,
+        )
+        for positions in (
+            order[start : start + shard_size] for start in range(0, len(order), shard_size)
+        )
+    ]
+
+    worker_abstracts, worker_seconds = defaultdict(int), defaultdict(float)
+    context = multiprocessing.get_context(start_method)
+    with context.Pool(
+        n_workers,
+        initializer=_init_worker,
+        initargs=(model, backend, threads_per_worker),
+    ) as pool:
+        for pid, batch, elapsed in pool.imap_unordered(_summarize_shard, shards):
+            worker_abstracts[pid] += len(batch)
+            worker_seconds[pid] += elapsed
+            yield batch
+
+    for pid in worker_abstracts:
+        logging.info(
+            f"Summarization worker {pid} ({threads_per_worker} threads): "
+            f"{worker_abstracts[pid]} abstracts in {worker_seconds[pid]:.1f}s, "
+            f"{worker_abstracts[pid] / max(worker_seconds[pid], 1e-9):.2f} abstracts/s"
+        )
@@ -0,0 +1,97 @@
+"""Summary Cache
+
+Content-addressed cache of model summaries. A summary is keyed by a hash of
+everything that determines it: the abstract, the prompt, the model and the
+generation parameters. Each summary is committed as soon as it is stored,
+so the cache doubles as a checkpoint: an interrupted run resumes where it
+stopped, and re-runs only summarize abstracts that are actually new.
+
+Structure:
+    1. Imports, Variables
+    2. Functions
+    3. SummaryCache
+"""
+# 1. Imports, Variables
+# imports
+import hashlib
+import json
+import os
+import sqlite3
+
+# variables
+default_path = os.path.join("..", "results", "pubmed.sqlite")
+max_sql_variables = 500  # keys per IN (...) query
+
+
+# 2. Functions
+def summary_key(abstract, prompt, model, **generation_params):
+    """
+    Hash of the inputs of a summary, e.g.
+    summary_key(abstract, prompt, "../bart-large-cnn", max_length=40, min_length=10)
+    """
+    payload = json.dumps(
+        [abstract, prompt, model, sorted(generation_params.items())],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# 3. SummaryCache
+class SummaryCache:
+    """SQLite-backed {key: summary} store.
+
+    >>> with SummaryCache() as cache:
+    ...     summaries = cache.get_many(keys)
+    ...     cache.put(key, summary)
+    """
+
+    def __init__(self, path=default_path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                summary TEXT
+            )
+            """
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get_many(self, keys):
+        """Return {key: summary} for the keys that are in the cache."""
+        keys = list(dict.fromkeys(keys))
+        summaries = {}
+        for start in range(0, len(keys), max_sql_variables):
+            chunk = keys[start : start + max_sql_variables]
+            placeholders = ",".join("?" * len(chunk))
+            summaries.update(
+                self.connection.execute(
+                    f"SELECT key, summary FROM summaries WHERE key IN ({placeholders})",
+                    chunk,
+                )
+            )
+        self.hits += len(summaries)
+        self.misses += len(keys) - len(summaries)
+        return summaries
+
+    def put(self, key, summary):
+        """Store a summary and commit it right away (checkpoint)."""
+        self.put_many({key: summary})
+
+    def put_many(self, summaries):
+        """Store {key: summary} and commit."""
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?)", summaries.items()
+            )
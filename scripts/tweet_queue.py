@@ -0,0 +1,325 @@
+"""Tweet Queue
+
+Transactional queue of papers to tweet, shared by the reader (enqueue) and
+the writer (claim, mark posted), replacing the read-all/rewrite-all cycle
+over papers_to_tweet.csv and tweeted_pmids.json.
+
+The queue is a SQLite database in WAL mode, so the reader can enqueue while
+the writer is claiming. Every paper goes through:
+    pending -> claimed -> posted
+                       -> pending (released: the post failed)
+                       -> failed (released too many times)
+Claiming is a single indexed transaction, O(log n) whatever the history
+size. Papers are claimed in a random order fixed at enqueue time, like the
+random pick of the former CSV writer; a released paper goes to the back of
+the queue, so a paper that keeps failing cannot block the others.
+
+A paper is marked claimed *before* it is posted, so a crash between posting
+and `mark_posted` leaves it claimed rather than pending: it is never tweeted
+twice. Such papers are reported by `stale_claims` for manual checking.
+
+With several publishing channels (publisher.py), the delivery of each paper
+on each channel is tracked in a `deliveries` table (posted or failed, post
+id, error, attempts): a paper is marked posted once it is out on at least
+one channel, and its failed deliveries are retried on their own.
+
+Usage:
+    python tweet_queue.py --import-store ../results/papers --import-tweeted ../results/tweeted_pmids.json
+
+Structure:
+    1. Imports, Variables
+    2. TweetQueue
+    3. Main
+"""
+# 1. Imports, Variables
+# imports
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import time
+
+# variables
+default_path = os.path.join("..", "results", "tweet_queue.sqlite")
+max_sql_variables = 500  # PMIDs per IN (...) query
+queue_columns = ("pmid", "title", "doi_link", "abstract_summary", "tweet_text")
+
+
+# 2. TweetQueue
+class TweetQueue:
+    """SQLite (WAL) queue of papers to tweet.
+
+    >>> with TweetQueue() as queue:
+    ...     paper = queue.claim()
+    ...     ...  # post it
+    ...     queue.mark_posted(paper["pmid"])
+    """
+
+    def __init__(self, path=default_path, timeout=30):
+        self.path = path
+        # autocommit mode: transactions are opened explicitly
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS queue (
+                pmid INTEGER PRIMARY KEY,
+                title TEXT,
+                doi_link TEXT,
+                abstract_summary TEXT,
+                tweet_text TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                rank INTEGER NOT NULL,
+                enqueued_at REAL,
+                claimed_at REAL,
+                posted_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS queue_status_rank ON queue (status, rank);
+            CREATE TABLE IF NOT EXISTS deliveries (
+                pmid INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                status TEXT NOT NULL,
+                post_id TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL,
+                PRIMARY KEY (pmid, channel)
+            );
+            """
+        )
+        # queues created before tweets were pre-rendered, or before
+        # releases were counted
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(queue)")]
+        if "tweet_text" not in columns:
+            self.connection.execute("ALTER TABLE queue ADD COLUMN tweet_text TEXT")
+        if "attempts" not in columns:
+            self.connection.execute(
+                "ALTER TABLE queue ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _transaction(self, sql, parameters=(), many=False):
+        """Run one statement in an immediate write transaction and return
+        its rows (for RETURNING)."""
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            if many:
+                rows = self.connection.executemany(sql, parameters).fetchall()
+            else:
+                rows = self.connection.execute(sql, parameters).fetchall()
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return rows
+
+    # reader side
+    def enqueue(self, papers):
+        """Add papers as pending. Papers already in the queue, whatever
+        their status, are left untouched. Returns the number added."""
+        now = time.time()
+        rows = [
+            (
+                int(paper["pmid"]),
+                paper["title"],
+                paper["doi_link"],
+                paper.get("abstract_summary"),
+                paper.get("tweet_text"),
+                random.getrandbits(62),
+                now,
+            )
+            for paper in papers
+        ]
+        before = self.connection.total_changes
+        self._transaction(
+            "INSERT OR IGNORE INTO queue "
+            "(pmid, title, doi_link, abstract_summary, tweet_text, rank, enqueued_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+            many=True,
+        )
+        return self.connection.total_changes - before
+
+    def _select_pmids(self, pmids, condition):
+        pmids = [int(pmid) for pmid in pmids]
+        selected = set()
+        for start in range(0, len(pmids), max_sql_variables):
+            chunk = pmids[start : start + max_sql_variables]
+            placeholders = ",".join("?" * len(chunk))
+            selected.update(
+                row[0]
+                for row in self.connection.execute(
+                    f"SELECT pmid FROM queue WHERE {condition} AND pmid IN ({placeholders})",
+                    chunk,
+                )
+            )
+        return selected
+
+    def posted_pmids(self, pmids):
+        """Return the PMIDs of `pmids` that have already been posted."""
+        return self._select_pmids(pmids, "status = 'posted'")
+
+    def queued_pmids(self, pmids):
+        """Return the PMIDs of `pmids` already in the queue, whatever their
+        status."""
+        return self._select_pmids(pmids, "1 = 1")
+
+    # writer side
+    def claim(self):
+        """Atomically take the next pending paper, as a dict, or None if
+        the queue is empty."""
+        rows = self._transaction(
+            "UPDATE queue SET status = 'claimed', claimed_at = ? "
+            "WHERE pmid = (SELECT pmid FROM queue WHERE status = 'pending' ORDER BY rank LIMIT 1) "
+            f"RETURNING {', '.join(queue_columns)}",
+            (time.time(),),
+        )
+        return dict(rows[0]) if rows else None
+
+    def mark_posted(self, pmid):
+        self._transaction(
+            "UPDATE queue SET status = 'posted', posted_at = ? WHERE pmid = ?",
+            (time.time(), int(pmid)),
+        )
+
+    def release(self, pmid, max_attempts=None):
+        """Put a claimed paper back in the queue (its post failed), behind
+        every pending paper. After `max_attempts` releases it is parked as
+        failed instead. Returns its new status, or None if it was not
+        claimed."""
+        rows = self._transaction(
+            "UPDATE queue SET claimed_at = NULL, attempts = attempts + 1, "
+            "status = CASE WHEN ? IS NOT NULL AND attempts + 1 >= ? THEN 'failed' ELSE 'pending' END, "
+            "rank = COALESCE((SELECT MAX(rank) FROM queue WHERE status = 'pending'), rank) + 1 "
+            "WHERE pmid = ? AND status = 'claimed' RETURNING status",
+            (max_attempts, max_attempts, int(pmid)),
+        )
+        return rows[0][0] if rows else None
+
+    def stale_claims(self):
+        """PMIDs left claimed, e.g. by a crash between posting and
+        mark_posted. They are not retried automatically."""
+        return [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT pmid FROM queue WHERE status = 'claimed'"
+            )
+        ]
+
+    def pending(self):
+        """Pending papers, as dicts, in claim order."""
+        return [
+            dict(row)
+            for row in self.connection.execute(
+                f"SELECT {', '.join(queue_columns)} FROM queue "
+                "WHERE status = 'pending' ORDER BY rank"
+            )
+        ]
+
+    def counts(self):
+        """Number of papers per status."""
+        return dict(
+            self.connection.execute("SELECT status, COUNT(*) FROM queue GROUP BY status")
+        )
+
+    # deliveries, per channel
+    def record_delivery(self, pmid, channel, post_id=None, error=None):
+        """Record a delivery attempt of a paper on `channel`: posted with
+        `post_id`, or failed with `error`."""
+        self._transaction(
+            "INSERT INTO deliveries (pmid, channel, status, post_id, error, attempts, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, 1, ?) "
+            "ON CONFLICT (pmid, channel) DO UPDATE SET status = excluded.status, "
+            "post_id = excluded.post_id, error = excluded.error, "
+            "attempts = attempts + 1, updated_at = excluded.updated_at",
+            (int(pmid), channel, "posted" if post_id else "failed", post_id, error, time.time()),
+        )
+
+    def delivered_channels(self, pmid):
+        """Channels a paper has been posted on."""
+        return {
+            row[0]
+            for row in self.connection.execute(
+                "SELECT channel FROM deliveries WHERE pmid = ? AND status = 'posted'", (int(pmid),)
+            )
+        }
+
+    def failed_deliveries(self, channels, max_attempts):
+        """Failed deliveries of posted papers on `channels` with fewer than
+        `max_attempts` attempts, as a list of (paper dict, channel names)."""
+        channels = list(channels)
+        if not channels:
+            return []
+        placeholders = ",".join("?" * len(channels))
+        failed = {}
+        for row in self.connection.execute(
+            f"SELECT {', '.join('q.' + column for column in queue_columns)}, d.channel "
+            "FROM deliveries d JOIN queue q ON q.pmid = d.pmid "
+            f"WHERE d.status = 'failed' AND q.status = 'posted' AND d.channel IN ({placeholders}) "
+            "AND d.attempts < ? ORDER BY d.updated_at",
+            [*channels, max_attempts],
+        ):
+            paper, names = failed.setdefault(row["pmid"], (dict(row), []))
+            names.append(row["channel"])
+        for paper, names in failed.values():
+            del paper["channel"]
+        return list(failed.values())
+
+    def delivery_counts(self):
+        """Number of deliveries per (channel, status)."""
+        return {
+            (channel, status): n
+            for channel, status, n in self.connection.execute(
+                "SELECT channel, status, COUNT(*) FROM deliveries GROUP BY channel, status"
+            )
+        }
+
+    # migration
+    def import_tweeted(self, pmids):
+        """Record PMIDs tweeted before the queue existed as posted."""
+        now = time.time()
+        self._transaction(
+            "INSERT INTO queue (pmid, status, rank, posted_at) VALUES (?, 'posted', 0, ?) "
+            "ON CONFLICT (pmid) DO UPDATE SET status = 'posted', posted_at = excluded.posted_at",
+            [(int(pmid), now) for pmid in pmids],
+            many=True,
+        )
+
+
+# 3. Main
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Maintain the tweet queue.")
+    parser.add_argument("--path", default=default_path)
+    parser.add_argument("--import-store", help="enqueue the papers of a paper store")
+    parser.add_argument("--import-tweeted", help="mark the PMIDs of a JSON list as posted")
+    args = parser.parse_args()
+
+    with TweetQueue(args.path) as queue:
+        if args.import_tweeted:
+            with open(args.import_tweeted) as f:
+                content = f.read()
+            queue.import_tweeted(json.loads(content) if content.strip() else [])
+        if args.import_store:
+            from paper_store import PaperStore
+
+            papers = PaperStore(args.import_store).read_table(list(queue_columns)).to_pylist()
+            logging.info(f"Enqueued {queue.enqueue(papers)} of {len(papers)} papers")
+        logging.info(f"Queue: {queue.counts()}")
+        if queue.delivery_counts():
+            logging.info(f"Deliveries: {queue.delivery_counts()}")
+        if queue.stale_claims():
+            logging.warning(f"Claimed but never marked posted: {queue.stale_claims()}")
@@ -0,0 +1,194 @@
+"""Tweet Render
+
+Renders the final tweet text of a whole table of papers at once, so the
+writer only has to post pre-rendered text and every pending tweet can be
+checked ahead of time.
+
+Lengths are weighted the way the platform counts them (twitter-text v3):
+    - every URL counts as `url_length` characters, whatever its real length
+      (links are shortened by the platform), or as its real length with
+      `url_length=None` (platforms that post links as plain text),
+    - code points in the Latin/common punctuation ranges count 1, all other
+      code points (CJK, emoji, ...) count 2.
+ASCII text, which is nearly all of it, is measured with vectorized pandas
+string operations; only the few non-ASCII strings are weighted one code
+point at a time.
+
+Layout, same as the former per-post logic of the writer:
+    - title, summary and link when the summary fits,
+    - title, truncated summary and link when there is room for at least
+      `min_abstract_length` characters of summary,
+    - title and link otherwise, with the title truncated if needed.
+`limit` and `url_length` default to X's; other channels of the publisher
+(Mastodon, Bluesky) render with their own.
+
+Usage:
+    python tweet_render.py --check   # lengths of every pending tweet
+
+Structure:
+    1. Imports, Variables
+    2. Weighted Length
+    3. Rendering
+    4. Main
+"""
+# 1. Imports, Variables
+# imports
+import argparse
+import logging
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# variables
+max_length = 280
+url_length = 23
+min_abstract_length = 60
+url_pattern = r"https?://\S+"
+light_ranges = ((0, 4351), (8192, 8205), (8208, 8223), (8242, 8247))
+
+
+# 2. Weighted Length
+def char_weight(char):
+    code = ord(char)
+    return 1 if any(start <= code <= end for start, end in light_ranges) else 2
+
+
+def weighted_length_of(text, url_length=url_length):
+    """Weighted length of a single string."""
+    text = unicodedata.normalize("NFC", text)
+    if url_length is not None:
+        text = re.sub(url_pattern, "x" * url_length, text)
+    return sum(char_weight(char) for char in text)
+
+
+def weighted_length(texts, url_length=url_length):
+    """Weighted lengths of a Series of strings, as a numpy array."""
+    texts = texts.fillna("").astype(str)
+    shortened = texts
+    if url_length is not None:
+        shortened = texts.str.replace(url_pattern, "x" * url_length, regex=True)
+    lengths = shortened.str.len().to_numpy(dtype=np.int64, copy=True)
+    wide = ~texts.str.isascii().to_numpy(dtype=bool)
+    if wide.any():
+        lengths[wide] = [weighted_length_of(text, url_length) for text in texts[wide]]
+    return lengths
+
+
+def truncate(texts, budgets):
+    """Cut each string of `texts` to its weighted budget."""
+    truncated = []
+    for text, budget in zip(texts, budgets):
+        budget = max(int(budget), 0)
+        if text.isascii():
+            truncated.append(text[:budget].rstrip())
+            continue
+        used, end = 0, 0
+        for end, char in enumerate(text):
+            used += char_weight(char)
+            if used > budget:
+                break
+        else:
+            end = len(text)
+        truncated.append(text[:end].rstrip())
+    return truncated
+
+
+# 3. Rendering
+def summary_budgets(df_papers, limit=max_length, url_length=url_length):
+    """Weighted length left for the summary of every row of `df_papers`
+    (columns title and doi_link), as a numpy array."""
+    title = df_papers["title"].fillna("").astype(str)
+    link = df_papers["doi_link"].fillna("").astype(str)
+    return limit - (weighted_length(title, url_length) + 1 + weighted_length(link, url_length)) - 2
+
+
+def render_tweets(df_papers, limit=max_length, url_length=url_length):
+    """
+    Return the tweet text of every row of `df_papers` (columns title,
+    doi_link and abstract_summary) as a Series aligned with it, each at
+    most `limit` long with links counted as `url_length`.
+    """
+    title = df_papers["title"].fillna("").astype(str)
+    link = df_papers["doi_link"].fillna("").astype(str)
+    has_summary = df_papers["abstract_summary"].notna().to_numpy()
+    summary = df_papers["abstract_summary"].fillna("").astype(str)
+
+    w_title = weighted_length(title, url_length)
+    w_link = weighted_length(link, url_length)
+    w_summary = weighted_length(summary, url_length)
+
+    base = w_title + 1 + w_link  # title\nlink
+    room = summary_budgets(df_papers, limit, url_length)  # limit - base - 2 (\n\n)
+    with_summary = has_summary & (base <= limit - min_abstract_length)
+    full_summary = with_summary & (w_summary <= room)
+    cut_summary = with_summary & ~full_summary
+    cut_title = ~with_summary & (base > limit)
+
+    tweets = title + "\n" + link
+    tweets[full_summary] = (title + "\n\n" + summary + "\n" + link)[full_summary]
+    if cut_summary.any():
+        tweets[cut_summary] = (
+            title[cut_summary]
+            + "\n\n"
+            + pd.Series(
+                truncate(summary[cut_summary], room[cut_summary] - 3),
+                index=summary.index[cut_summary],
+            )
+            + "...\n"
+            + link[cut_summary]
+        )
+    if cut_title.any():
+        tweets[cut_title] = (
+            pd.Series(
+                truncate(title[cut_title], limit - 1 - w_link[cut_title] - 3),
+                index=title.index[cut_title],
+            )
+            + "...\n"
+            + link[cut_title]
+        )
+
+    too_long = weighted_length(tweets, url_length) > limit
+    if too_long.any():
+        logging.warning(f"{too_long.sum()} tweets longer than {limit} characters")
+    return tweets
+
+
+def render_tweet(paper, limit=max_length, url_length=url_length):
+    """Tweet text of a single paper dict."""
+    return render_tweets(pd.DataFrame([paper]), limit, url_length)[0]
+
+
+def check_lengths(tweets):
+    """Return a DataFrame of the weighted length of each tweet and whether
+    it fits."""
+    lengths = weighted_length(pd.Series(tweets))
+    return pd.DataFrame({"length": lengths, "fits": lengths <= max_length})
+
+
+# 4. Main
+if __name__ == "__main__":
+    from tweet_queue import TweetQueue, default_path
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Check pending tweets.")
+    parser.add_argument("--check", action="store_true", help="check pending tweet lengths")
+    parser.add_argument("--queue", default=default_path)
+    args = parser.parse_args()
+
+    if args.check:
+        with TweetQueue(args.queue) as queue:
+            pending = pd.DataFrame(queue.pending())
+        if pending.empty:
+            logging.info("No pending tweets.")
+        else:
+            # papers queued before rendering existed are rendered on the fly
+            tweets = pending["tweet_text"].where(
+                pending["tweet_text"].notna(), render_tweets(pending)
+            )
+            lengths = check_lengths(tweets)
+            logging.info(
+                f"{len(lengths)} pending tweets, {(~lengths['fits']).sum()} too long, "
+                f"max {lengths['length'].max()} / {max_length}"
+            )
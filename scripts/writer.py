@@ -1,168 +1,139 @@
 """Writer
 
+Publishes the papers queued by the reader at random times of the day, on
+every configured channel (`channels`: X accounts, Mastodon, Bluesky, see
+publisher.py). Each paper is posted on all channels concurrently; the
+delivery on each channel is recorded in the tweet queue, and deliveries
+that failed are retried at the next slots, up to `max_delivery_attempts`.
+One event loop and one publisher live as long as the writer, so the
+channels keep their HTTP session, rate limits and logins between slots;
+they are closed when the writer stops.
+
+Two schedulers are available (`scheduler_mode`):
+    - "timers": the day's random slots are kept in a heap of timers and the
+      process sleeps until the next deadline, waking up only to tweet and
+      to plan the next day,
+    - "schedule": the previous loop polling `schedule` every second.
+Every slot is instrumented like the reader's stages (see
+instrumentation.py), with the requests and latencies of each channel: the
+writer's report in results/reports/ is rewritten after each slot, and
+`prometheus_path` optionally exports the metrics of the last one.
+
 Structure:
     1. Imports, Variables, Functions
-    2. Tweet Papers
+    2. Publish Papers
 """
 
 # 1. Imports, Variables, Functions
 # imports
+import asyncio
+import heapq
+import itertools
 import schedule
 import time
 import random
-import pandas as pd, json, os
+import os
 from dotenv import load_dotenv
 import os
-import tweepy
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
+import instrumentation
+from publisher import BlueskyChannel, MastodonChannel, Publisher, XChannel
+from tweet_queue import TweetQueue
 logging.basicConfig(level=logging.INFO)
+load_dotenv()  # Load environment variables from .env file
 
 # variables
 n_daily_tweets = random.choice([1,2,3])  # Number of tweets per day
 n_daily_tweets = 3
+tweet_queue_path = os.path.join("..", "results", "tweet_queue.sqlite")
+scheduler_mode = "timers"  # "timers" (sleep until the next tweet) or "schedule" (poll every second)
+max_sleep = 60 * 60  # re-check the clock at least hourly (suspend, clock changes)
+# channels, posted to concurrently; credentials are read from .env
+channels = [
+    XChannel("x"),  # API_KEY, API_KEY_SECRET, ACCESS_TOKEN, ACCESS_TOKEN_SECRET
+    # XChannel("x-lab", env_prefix="LAB_"),  # LAB_API_KEY, ...
+    # MastodonChannel("mastodon", "https://mastodon.social/", token_env="MASTODON_TOKEN"),
+    # BlueskyChannel("bluesky", handle_env="BLUESKY_HANDLE", password_env="BLUESKY_APP_PASSWORD"),
+]
+max_delivery_attempts = 3  # slots at which a failed delivery is tried
+loop = asyncio.new_event_loop()  # runs every slot's posts
+publisher = Publisher(channels)  # opened on `loop` for the writer's lifetime
+report_dir = os.path.join("..", "results", "reports")
+prometheus_path = None  # e.g. a node exporter textfile, None to disable
+run = instrumentation.Run("writer", report_dir, prometheus_path)
 
 # functions
-def load_tweeted_pmids():
-    path_tweeted_pmids = os.path.join("..","results","tweeted_pmids.json")
-
+def tweet_paper():
+    """Publish a paper, as an instrumented "publish" stage of the writer's run."""
     try:
-        with open(path_tweeted_pmids, 'r') as f:
-            return set(json.load(f))  # Load and convert list back to set
-    except FileNotFoundError:
-        return set()  # Return an empty set if the file doesn't exist
-
-def save_tweeted_pmids(tweeted_pmids):
-    path_tweeted_pmids = os.path.join("..", "results", "tweeted_pmids.json")
-    with open(path_tweeted_pmids, "w") as f:
-        # Ensure all elements are converted to Python native int before serialization
-        tweeted_pmids_list = [int(pmid) for pmid in tweeted_pmids]
-        json.dump(tweeted_pmids_list, f)
+        with run.stage("publish") as metrics:
+            metrics.items_out = _publish_paper(metrics)
+    finally:
+        run.write()
 
 
-def tweet_paper():
-    """Tweet Paper
+def _publish_paper(metrics):
+    """Publish Paper, return the number of deliveries posted.
     Structure:
         1. Load Data
-        2. Tweet Paper
+        2. Publish Paper
         3. Save Data"""
 
     # 1. Load Data
-
-    load_dotenv()  # Load environment variables from .env file
-
-    api_key = os.getenv("API_KEY")
-    api_key_secret = os.getenv("API_KEY_SECRET")
-    bearer_token = os.getenv("BEARER_TOKEN")
-    access_token = os.getenv("ACCESS_TOKEN")
-    access_token_secret = os.getenv("ACCESS_TOKEN_SECRET")
-    path_csv = os.path.join("..","results","papers_to_tweet.csv")
-
-    global df_papers  # Ensure we're modifying the global DataFrame
-
-    # Load the latest DataFrame and tweeted_pmids at the beginning of each call
-    df_papers = pd.read_csv(path_csv)
-    tweeted_pmids = load_tweeted_pmids()
-
-    # check if the papers haven't been tweeted already
-    available_papers = df_papers[~df_papers['pmid'].isin(tweeted_pmids)]
-    if available_papers.empty:
-        logging.info("All papers have been tweeted.")
-        return
-    paper = available_papers.sample(1).iloc[0]  # Randomly select an untweeted paper
-
-    min_abstract_length = 60
-    # check if the paper has an abstract
-    if isinstance(paper["abstract_summary"], str):
-
-        # check there is room for abstract ! ! !
-        tweet_content = f"{paper['title']}\n{paper['doi_link']}"
-
-        # check if there is room for abstract
-        if len(tweet_content) < 280 - min_abstract_length:
-            # There is room for an abstract ! ! !
-            room_available = 280 - len(tweet_content) - 2  # +2 \n\n
-            # check if there is room for entire abstract summary
-            if len(paper["abstract_summary"]) < room_available:
-                logging.info("Title + abstract summary")
-                tweet_content = f"{paper['title']}\n\n{paper['abstract_summary']}\n{paper['doi_link']}"
-            # check if there is room for a truncated abstract summary
-            else:
-                logging.info("Title + truncated abstract summary")
-                tweet_content = f"{paper['title']}\n\n{paper['abstract_summary'][:room_available-5]}...\n{paper['doi_link']}"
-
-        else:
-            # check if there is room for a title ! ! !
-
-            if len(tweet_content) < 280:
-                logging.info("Title")
-                # redundant
-                tweet_content = f"{paper['title']}\n{paper['doi_link']}"
-            else:
-                logging.info("Truncated title")
-                space_left = 280 - len(tweet_content)
-                tweet_content = (
-                    f"{paper['title'][:space_left-4]}...\n{paper['doi_link']}"
-                )
-
-        assert (
-            len(tweet_content) <= 280
-        ), f"Tweet content too long: {len(tweet_content)} characters"
-
-    # If the paper doesn't have an abstract, tweet the title and DOI link
-    else:
-        # check there is room for abstract ! ! !
-        tweet_content = f"{paper['title']}\n{paper['doi_link']}"
-        # check if there is room for a title ! ! !
-        if len(tweet_content) < 280:
-            logging.info("Title")
-
-            # redundant
-            tweet_content = f"{paper['title']}\n{paper['doi_link']}"
-        else:
-            logging.info("Truncated title")
-            space_left = 280 - len(tweet_content)
-            tweet_content = f"{paper['title'][:space_left-4]}...\n{paper['doi_link']}"
-
-        assert (
-            len(tweet_content) <= 280
-        ), f"Tweet content too long: {len(tweet_content)} characters"
-
-
-
-    # 2. Tweet Paper
-    # Attempt to tweet the content
+    # Claim the next paper (in random order); it stays claimed until it is
+    # out, so it can never be published twice. Deliveries that failed at
+    # earlier slots are retried along with it.
+    names = [channel.name for channel in channels]
+    queue = TweetQueue(tweet_queue_path)
     try:
-        # Authentication
-        client = tweepy.Client(
-        consumer_key=api_key,
-        consumer_secret=api_key_secret,
-        access_token=access_token,
-        access_token_secret=access_token_secret,
-        )
-        auth = tweepy.OAuth1UserHandler(
-        api_key, api_key_secret, access_token, access_token_secret
-        )
-        api = tweepy.API(auth)
-
-        # posting tweet
-        client.create_tweet(text=tweet_content)
-        logging.info(f"Successfully tweeted: {tweet_content}")
-
-        # 3. Save Data
-        # updated the tweeted_pmids
-        tweeted_pmids.add(paper['pmid'])  # Mark this paper as tweeted
-        save_tweeted_pmids(tweeted_pmids)  # Save the updated set of tweeted PMIDs
-
-        # Remove the tweeted paper from the DataFrame and save the update
-        df_papers = df_papers[~df_papers['pmid'].isin(tweeted_pmids)]
-        df_papers.to_csv(path_csv, index=False)
-
-    except Exception as e:
-        logging.info(f"Failed to tweet: {e}")
-
-def schedule_tweets(n_daily_tweets=5):
+        items = queue.failed_deliveries(names, max_delivery_attempts)
+        paper = queue.claim()
+        if paper is not None:
+            delivered = queue.delivered_channels(paper["pmid"])
+            items.insert(0, (paper, [name for name in names if name not in delivered]))
+        else:
+            logging.info("All papers have been tweeted.")
+        metrics.items_in = len(items)
+        if not items:
+            return 0
+
+        # 2. Publish Paper
+        # On every channel at once, each with its text rendered for it
+        # (papers queued before the reader rendered tweets included)
+        n_posted = 0
+        try:
+            results = loop.run_until_complete(publisher.publish_papers(items))
+
+            # 3. Save Data
+            for (item_paper, _), result in zip(items, results):
+                for name, (post_id, error) in result.items():
+                    queue.record_delivery(item_paper["pmid"], name, post_id, error)
+                    if post_id:
+                        n_posted += 1
+                        logging.info(f"Posted on {name}: {item_paper['title']}")
+                    else:
+                        logging.info(f"Failed to post on {name}: {error}")
+            if paper is not None and queue.delivered_channels(paper["pmid"]):
+                queue.mark_posted(paper["pmid"])  # out on at least one channel
+                paper = None
+        except Exception as e:
+            logging.exception(f"Failed to publish: {e}")
+        if paper is not None:
+            # back in the queue for a later slot, behind the other papers;
+            # channels it is already out on are skipped then
+            if queue.release(paper["pmid"], max_delivery_attempts) == "failed":
+                logging.warning(f"Gave up on {paper['pmid']} after {max_delivery_attempts} attempts")
+    finally:
+        queue.close()
+    return n_posted
+
+
+def pick_tweet_times(n_daily_tweets=5):
+    """Pick today's random tweet times between 8:00 and 17:59 that are
+    still ahead of now."""
     current_time = datetime.now()
+    tweet_times = []
     for _ in range(n_daily_tweets):
         attempts = 0
         while True:
@@ -172,8 +143,7 @@ def schedule_tweets(n_daily_tweets=5):
             schedule_time = datetime.strptime(f"{current_time.strftime('%Y-%m-%d')} {schedule_time_str}", '%Y-%m-%d %H:%M')
 
             if schedule_time > datetime.now():  # Always compare to the current moment
-                schedule.every().day.at(schedule_time_str).do(tweet_paper).tag('daily-tweets')
-                logging.info(f"Scheduled a tweet at {schedule_time_str}")
+                tweet_times.append(schedule_time)
                 break
             else:
                 attempts += 1
@@ -181,22 +151,76 @@ def schedule_tweets(n_daily_tweets=5):
                 if attempts > 1000:  # Prevent infinite loop
                     logging.warning("Too many failed attempts to find a future time. Skipping this tweet.")
                     break
+    return tweet_times
+
+def schedule_tweets(n_daily_tweets=5):
+    for schedule_time in pick_tweet_times(n_daily_tweets):
+        schedule_time_str = schedule_time.strftime("%H:%M")
+        schedule.every().day.at(schedule_time_str).do(tweet_paper).tag('daily-tweets')
+        logging.info(f"Scheduled a tweet at {schedule_time_str}")
 
 def reset_and_schedule_tweets():
     # Clearing schedules tagged as 'daily-tweets'
     schedule.clear('daily-tweets')
     logging.info("Cleared all scheduled tweets.")
-    schedule_tweets()
+    schedule_tweets(n_daily_tweets)
 
-# 2.
-# Schedule the reset function to run daily at 00:01
-schedule.every().day.at("00:01").do(reset_and_schedule_tweets)
 
-# Start by scheduling today's tweets
-reset_and_schedule_tweets()
+class Timers:
+    """Heap of (deadline, job) timers run by a single sleeping thread."""
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()  # tie-breaker for equal deadlines
 
-# Main loop to keep the script running and handle scheduled tasks
-while True:
-    schedule.run_pending()
-    time.sleep(1)
+    def at(self, deadline, job):
+        heapq.heappush(self.heap, (deadline, next(self.counter), job))
 
+    def run(self):
+        while self.heap:
+            deadline, _, job = self.heap[0]
+            delay = (deadline - datetime.now()).total_seconds()
+            if delay > 0:
+                time.sleep(min(delay, max_sleep))
+                continue
+            heapq.heappop(self.heap)
+            job()
+
+
+def plan_day(timers):
+    """Add today's tweets to `timers`, and the planning of the next day at
+    00:01."""
+    for schedule_time in pick_tweet_times(n_daily_tweets):
+        timers.at(schedule_time, tweet_paper)
+        logging.info(f"Scheduled a tweet at {schedule_time:%H:%M}")
+    tomorrow = datetime.now().replace(hour=0, minute=1, second=0, microsecond=0) + timedelta(days=1)
+    timers.at(tomorrow, lambda: plan_day(timers))
+
+
+# 2.
+# Papers claimed but never marked posted (crash mid-tweet) are not retried
+with TweetQueue(tweet_queue_path) as queue:
+    if queue.stale_claims():
+        logging.warning(f"Check if these papers were tweeted: {queue.stale_claims()}")
+
+loop.run_until_complete(publisher.open())
+try:
+    if scheduler_mode == "timers":
+        # Sleep until each deadline instead of polling
+        timers = Timers()
+        plan_day(timers)
+        timers.run()
+    else:
+        # Schedule the reset function to run daily at 00:01
+        schedule.every().day.at("00:01").do(reset_and_schedule_tweets)
+
+        # Start by scheduling today's tweets
+        reset_and_schedule_tweets()
+
+        # Main loop to keep the script running and handle scheduled tasks
+        while True:
+            schedule.run_pending()
+            time.sleep(1)
+finally:
+    loop.run_until_complete(publisher.close())
+    loop.close()